@@ -0,0 +1,182 @@
+"""
+Account Pool for Reddit Bot
+Spreads replies over several Reddit accounts, each with its own rate limit
+and health state, so throughput is not capped by a single account's budget
+
+Accounts are listed in config.ACCOUNTS as dictionaries with username,
+password and optionally client_id, client_secret and user_agent (which
+default to the main config values). Without ACCOUNTS the bot uses the single
+config.USERNAME login. config.SUBREDDIT_ACCOUNTS can restrict subreddits to
+particular accounts, e.g. {'mutualaid': ['helper_account']}.
+"""
+import time
+import logging
+import threading
+import prawcore
+from praw.exceptions import RedditAPIException
+import config
+import rate_limit
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Name used for the primary account when config has no USERNAME
+DEFAULT_USERNAME = getattr(config, 'USERNAME', 'bot')
+
+# Consecutive failed replies before an account is rested
+MAX_CONSECUTIVE_ERRORS = 3
+
+# First and longest rest for an unhealthy account, in seconds
+ERROR_COOLDOWN = 60
+MAX_ERROR_COOLDOWN = 3600
+
+# Failures that point at the account or its connection: a bad login, being
+# throttled, or Reddit being unreachable. Anything else, such as a locked or
+# deleted post, is about the post and leaves the account's health alone.
+ACCOUNT_ERRORS = (
+    prawcore.exceptions.OAuthException,
+    prawcore.exceptions.InvalidToken,
+    prawcore.exceptions.InsufficientScope,
+    prawcore.exceptions.TooManyRequests,
+    prawcore.exceptions.RequestException,
+    prawcore.exceptions.ServerError
+)
+
+# Reddit API error types that point at the account
+ACCOUNT_API_ERROR_TYPES = {'RATELIMIT', 'USER_REQUIRED'}
+
+def is_account_error(error):
+    """Return True if a failed reply says the account, not the post, is in trouble."""
+    if isinstance(error, ACCOUNT_ERRORS):
+        return True
+    if isinstance(error, RedditAPIException):
+        return any(item.error_type in ACCOUNT_API_ERROR_TYPES for item in error.items)
+    return False
+
+class Account:
+    """One Reddit login with its own token bucket and health state."""
+
+    def __init__(self, username, reddit=None, bucket=None):
+        self.username = username
+        # None means replies go through the submission's own Reddit instance
+        self.reddit = reddit
+        self.bucket = bucket or rate_limit.TokenBucket()
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.stats = {
+            'sent': 0,
+            'failed': 0,
+            'rate_limited': 0
+        }
+
+    def is_healthy(self, now=None):
+        return (now or time.monotonic()) >= self.cooldown_until
+
+    def target_for(self, post):
+        """Return the submission object to reply through for this account."""
+        if self.reddit is None:
+            return post
+        return self.reddit.submission(id=post.id)
+
+class AccountPool:
+    """Chooses which account sends each reply."""
+
+    def __init__(self, accounts, subreddit_accounts=None):
+        if not accounts:
+            raise ValueError("An account pool needs at least one account")
+        self.accounts = list(accounts)
+        self.subreddit_accounts = {subreddit.lower(): set(usernames)
+                                   for subreddit, usernames in (subreddit_accounts or {}).items()}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def eligible(self, subreddit):
+        """Return the accounts allowed to reply in a subreddit."""
+        allowed = self.subreddit_accounts.get((subreddit or '').lower())
+        if not allowed:
+            return self.accounts
+        # Fall back to every account rather than strand replies if none of
+        # the assigned ones could log in
+        return [account for account in self.accounts if account.username in allowed] or self.accounts
+
+    def allows(self, account, subreddit):
+        """Return True if the account may reply in a subreddit."""
+        return account in self.eligible(subreddit)
+
+    def acquire(self, account):
+        """Take a token from an account.
+
+        Returns 0 on success, or the seconds until the account is expected to
+        have budget again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not account.is_healthy(now):
+                return account.cooldown_until - now
+            return account.bucket.try_acquire()
+
+    def record_success(self, account):
+        with self._lock:
+            account.stats['sent'] += 1
+            account.consecutive_errors = 0
+
+    def record_rate_limit(self, account, wait):
+        with self._lock:
+            account.stats['rate_limited'] += 1
+            account.bucket.pause(wait)
+
+    def record_error(self, account, error=None):
+        """Count a failed reply, resting the account if it keeps hitting account errors."""
+        with self._lock:
+            account.stats['failed'] += 1
+            if error is not None and not is_account_error(error):
+                return
+            account.consecutive_errors += 1
+            if account.consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                exponent = account.consecutive_errors - MAX_CONSECUTIVE_ERRORS
+                cooldown = min(ERROR_COOLDOWN * 2 ** exponent, MAX_ERROR_COOLDOWN)
+                account.cooldown_until = time.monotonic() + cooldown
+                logger.warning(f"Account {account.username} failed {account.consecutive_errors} "
+                               f"times in a row, resting it for {cooldown} seconds")
+
+    def metrics(self):
+        """Return per-account throughput, error and health figures."""
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        now = time.monotonic()
+        with self._lock:
+            return {account.username: dict(
+                account.stats,
+                replies_per_minute=account.stats['sent'] * 60 / elapsed,
+                healthy=account.is_healthy(now),
+                cooldown_seconds=max(0.0, account.cooldown_until - now),
+                next_token_seconds=account.bucket.seconds_until_available()
+            ) for account in self.accounts}
+
+def create_account_pool(primary_reddit=None):
+    """Build the pool from config, reusing the already logged-in primary instance."""
+    # Imported here because reddit_bot imports the dispatcher, which imports this module
+    import reddit_bot
+
+    accounts = [Account(DEFAULT_USERNAME, reddit=None)]
+    for settings in getattr(config, 'ACCOUNTS', []):
+        if settings['username'] == DEFAULT_USERNAME:
+            continue
+        reddit = reddit_bot.create_reddit_instance(settings)
+        if reddit is None:
+            logger.error(f"Skipping account {settings['username']}: login failed")
+            continue
+        accounts.append(Account(settings['username'], reddit=reddit))
+
+    usernames = {account.username for account in accounts}
+    subreddit_accounts = getattr(config, 'SUBREDDIT_ACCOUNTS', {})
+    for subreddit, assigned in subreddit_accounts.items():
+        if not usernames.intersection(assigned):
+            logger.warning(f"No account assigned to r/{subreddit} is logged in; any account may reply there")
+
+    logger.info(f"Replying with {len(accounts)} account(s): {', '.join(a.username for a in accounts)}")
+    return AccountPool(accounts, subreddit_accounts)
@@ -1,16 +1,18 @@
 import os
 import json
 import time
-import threading
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, abort
 import logging
 from datetime import datetime
 
 # Import bot modules
-import reddit_bot
+import bot_controller
+import event_bus
+import metrics
 import message_templates
 import subreddit_manager
 import post_history
+import profiler
 
 # Configure logging
 logging.basicConfig(
@@ -37,57 +39,76 @@ def timestamp_to_time(timestamp):
     return datetime.fromtimestamp(timestamp).strftime('%H:%M:%S')
 
 # Global variables
-bot_thread = None
-bot_running = False
-bot_status = "Stopped"
 bot_last_action = "N/A"
-bot_start_time = None
 
-def run_bot_thread():
-    global bot_running, bot_status, bot_last_action
-    
-    bot_status = "Running"
-    bot_last_action = "Starting bot..."
+# Seconds between keepalive messages on an idle event stream
+EVENT_KEEPALIVE_SECONDS = 15
+
+# Length of a /debug/profile run when none is given, in seconds
+DEFAULT_PROFILE_SECONDS = 10
+
+def get_bot_status():
+    """Build the bot status shown on the dashboard."""
+    status = bot.status()
     
-    try:
-        reddit_bot.run_bot(status_callback=update_bot_status)
-    except Exception as e:
-        bot_status = f"Error: {str(e)}"
-        logger.error(f"Bot error: {str(e)}")
+    # Get bot runtime if running
+    runtime = None
+    if status['started_at']:
+        runtime = int(time.time() - status['started_at'])
     
-    bot_running = False
-    bot_status = "Stopped"
-    bot_last_action = "Bot stopped"
+    return {
+        'status': status['state'],
+        'running': status['running'],
+        'paused': status['paused'],
+        'last_action': bot_last_action,
+        'runtime': runtime,
+        'started_at': status['started_at'],
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def publish_bot_status():
+    """Push the current bot status to connected dashboards."""
+    event_bus.publish('status', get_bot_status())
+
+def on_bot_state_change(state):
+    publish_bot_status()
 
 def update_bot_status(action):
     global bot_last_action
     bot_last_action = action
     logger.info(action)
+    publish_bot_status()
+
+# Runs the bot in a background thread; state changes are pushed to the dashboard
+bot = bot_controller.BotController(status_callback=update_bot_status,
+                                   state_callback=on_bot_state_change)
 
 @app.route('/')
 def home():
+    status = get_bot_status()
+    
     # Get bot runtime if running
-    runtime = None
-    if bot_start_time:
-        runtime = int(time.time() - bot_start_time)
+    runtime = status['runtime']
+    if runtime is not None:
         hours, remainder = divmod(runtime, 3600)
         minutes, seconds = divmod(remainder, 60)
         runtime = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
     
     # Get statistics
     stats = {
-        "total_posts": len(post_history.get_all_posts()),
+        "total_posts": post_history.get_post_count(),
         "subreddits": len(subreddit_manager.get_all_subreddits()),
-        "templates": len(message_templates.get_all_templates()),
+        "templates": message_templates.get_template_count(),
         "active_subreddits": len(subreddit_manager.get_active_subreddits())
     }
     
     # Get recent posts
-    recent_posts = post_history.get_all_posts()[-5:] if post_history.get_all_posts() else []
+    recent_posts = post_history.get_recent_posts(5)
     
     return render_template('index.html', 
-                          bot_status=bot_status,
-                          bot_running=bot_running,
+                          bot_status=status['status'],
+                          bot_running=status['running'],
+                          bot_paused=status['paused'],
                           bot_last_action=bot_last_action,
                           runtime=runtime,
                           stats=stats,
@@ -95,25 +116,22 @@ def home():
 
 @app.route('/start_bot', methods=['POST'])
 def start_bot():
-    global bot_thread, bot_running, bot_start_time
-    
-    if not bot_running:
-        bot_running = True
-        bot_start_time = time.time()
-        bot_thread = threading.Thread(target=run_bot_thread)
-        bot_thread.daemon = True
-        bot_thread.start()
-        
+    bot.start()
     return redirect(url_for('home'))
 
 @app.route('/stop_bot', methods=['POST'])
 def stop_bot():
-    global bot_running, bot_start_time
-    
-    if bot_running:
-        bot_running = False
-        bot_start_time = None
-        
+    bot.stop()
+    return redirect(url_for('home'))
+
+@app.route('/pause_bot', methods=['POST'])
+def pause_bot():
+    bot.pause()
+    return redirect(url_for('home'))
+
+@app.route('/resume_bot', methods=['POST'])
+def resume_bot():
+    bot.resume()
     return redirect(url_for('home'))
 
 @app.route('/templates')
@@ -140,7 +158,7 @@ def edit_template(template_name):
         
         new_message = request.form.get('message')
         
-        # Update the template (you'll need to implement this in message_templates.py)
+        # Save the template; the bot picks up the change from the template store
         message_templates.update_template(template_name, new_keywords, new_message)
         
         return redirect(url_for('view_template', template_name=template_name))
@@ -155,7 +173,7 @@ def add_template():
         keywords = [k.strip() for k in keywords if k.strip()]
         message = request.form.get('message')
         
-        # Add the template (you'll need to implement this in message_templates.py)
+        # Save the template; the bot picks up the change from the template store
         message_templates.add_template(template_name, keywords, message)
         
         return redirect(url_for('templates'))
@@ -189,9 +207,31 @@ def toggle_subreddit(subreddit_name):
     
     return redirect(url_for('subreddits'))
 
+def parse_history_filters(args):
+    """Read the history filters from the query string.
+
+    Dates are YYYY-MM-DD; the end date includes the whole day.
+    """
+    filters = {
+        'subreddit': args.get('subreddit') or None,
+        'template': args.get('template') or None,
+        'since': None,
+        'until': None
+    }
+    if args.get('since'):
+        filters['since'] = int(datetime.strptime(args['since'], '%Y-%m-%d').timestamp())
+    if args.get('until'):
+        filters['until'] = int(datetime.strptime(args['until'], '%Y-%m-%d').timestamp()) + 86399
+    return filters
+
 @app.route('/history')
 def history():
-    posts = post_history.get_all_posts()
+    try:
+        filters = parse_history_filters(request.args)
+        posts, next_cursor = post_history.get_history_page(
+            cursor=request.args.get('cursor'), **filters)
+    except ValueError:
+        return redirect(url_for('history'))
     
     # Group by date
     posts_by_date = {}
@@ -201,22 +241,118 @@ def history():
             posts_by_date[date] = []
         posts_by_date[date].append(post)
     
-    return render_template('history.html', posts_by_date=posts_by_date)
+    # Filters to carry over to the next page
+    active_filters = {key: request.args[key] for key in ('subreddit', 'template', 'since', 'until')
+                      if request.args.get(key)}
+    
+    return render_template('history.html',
+                          posts_by_date=posts_by_date,
+                          next_cursor=next_cursor,
+                          filters=active_filters,
+                          template_names=message_templates.get_registry().names)
+
+@app.route('/api/history')
+def api_history():
+    try:
+        filters = parse_history_filters(request.args)
+        limit = None
+        if request.args.get('limit') is not None:
+            try:
+                limit = int(request.args['limit'])
+            except ValueError:
+                raise ValueError(f"Invalid limit: {request.args['limit']!r}")
+            if limit < 1:
+                raise ValueError("limit must be at least 1")
+        cursor = request.args.get('cursor')
+        if cursor:
+            post_history.parse_cursor(cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        # Stream the posts page by page instead of building the whole list
+        next_cursor = cursor
+        sent = 0
+        yield '{"posts": ['
+        while True:
+            page_size = post_history.HISTORY_PAGE_SIZE
+            if limit is not None:
+                page_size = min(page_size, limit - sent)
+            posts, next_cursor = post_history.get_history_page(page_size, next_cursor, **filters)
+            for post in posts:
+                yield (',' if sent else '') + json.dumps(post)
+                sent += 1
+            if next_cursor is None or (limit is not None and sent >= limit):
+                break
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Pipeline stage timings and counters in the Prometheus text format."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample the running threads and return collapsed stacks for a flamegraph.
+
+    Query parameters: seconds, interval_ms, and threads (comma-separated
+    thread name prefixes such as reddit-bot,stream-,reply-dispatcher).
+    """
+    if not profiler.DEBUG_ENDPOINTS:
+        abort(404)
+    seconds = request.args.get('seconds', DEFAULT_PROFILE_SECONDS, type=float)
+    interval = request.args.get('interval_ms', profiler.PROFILE_INTERVAL * 1000, type=float) / 1000
+    threads = [prefix for prefix in request.args.get('threads', '').split(',') if prefix]
+    
+    try:
+        stacks, samples = profiler.sample(seconds, max(interval, 0.001), threads)
+    except profiler.ProfilerBusy as e:
+        return Response(str(e) + '\n', status=409, mimetype='text/plain')
+    
+    filename = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+    return Response(profiler.format_collapsed(stacks), mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Profile-Samples': str(samples)})
+
+@app.route('/debug/stacks')
+def debug_stacks():
+    """Current stack of every thread."""
+    if not profiler.DEBUG_ENDPOINTS:
+        abort(404)
+    return Response(profiler.dump_stacks(), mimetype='text/plain')
 
 @app.route('/api/status')
 def api_status():
-    # Get bot runtime if running
-    runtime = None
-    if bot_start_time:
-        runtime = int(time.time() - bot_start_time)
+    return jsonify(get_bot_status())
+
+def format_event(event_type, data):
+    """Format an event as a Server-Sent Events message."""
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/events')
+def api_events():
+    subscription = event_bus.subscribe()
     
-    return jsonify({
-        'status': bot_status,
-        'running': bot_running,
-        'last_action': bot_last_action,
-        'runtime': runtime,
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    })
+    def generate():
+        try:
+            # Send the current state first so the page doesn't wait for a change
+            yield format_event('status', get_bot_status())
+            while True:
+                events = subscription.get(timeout=EVENT_KEEPALIVE_SECONDS)
+                if not events:
+                    # Comment line to keep proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                for event_type, data in events:
+                    yield format_event(event_type, data)
+        finally:
+            subscription.close()
+    
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist
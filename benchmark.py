@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Matching Pipeline Benchmark for Reddit Bot
+Replays synthetic submissions against synthetic template sets of varying size
+and reports throughput, per-post latency and memory use
+"""
+import sys
+import random
+import argparse
+import logging
+import tracemalloc
+from contextlib import contextmanager
+import message_templates
+import replay
+
+def make_templates(template_count, keywords_per_template, seed=0):
+    """Build a synthetic TEMPLATES dictionary with two-word keywords."""
+    rng = random.Random(seed)
+    vocabulary = [f"{rng.choice(replay.FILLER_WORDS)}{i}" for i in range(2000)]
+    templates = {}
+    for t in range(template_count):
+        keywords = [f"{rng.choice(vocabulary)} {rng.choice(vocabulary)}"
+                    for _ in range(keywords_per_template)]
+        templates[f"Template {t}"] = {
+            'keywords': keywords,
+            'message': f"Synthetic reply {t}",
+            'description': f"Synthetic template {t}"
+        }
+    return templates
+
+@contextmanager
+def swapped_templates(templates):
+    """Temporarily replace the bot's templates, keeping the template store out of it."""
+    original = message_templates.TEMPLATES
+    original_db = message_templates.TEMPLATES_DB
+    message_templates.use_store(None)
+    message_templates.TEMPLATES = templates
+    message_templates.invalidate_templates()
+    try:
+        yield
+    finally:
+        message_templates.TEMPLATES = original
+        message_templates.use_store(original_db)
+
+def run_case(template_count, keywords_per_template, text_length, posts, keyword_rate, seed=0):
+    """Benchmark one combination of template count, keyword count and text length."""
+    templates = make_templates(template_count, keywords_per_template, seed)
+    keywords = [keyword for data in templates.values() for keyword in data['keywords']]
+
+    with swapped_templates(templates):
+        # Build the matcher up front so it is not counted against the first post
+        message_templates.get_matcher()
+
+        sink = replay.ReplySink()
+        submissions = list(replay.generate_submissions(
+            posts, sink, keyword_rate, text_length, keywords=keywords, seed=seed))
+        results = replay.run_replay(submissions, sink)
+
+        # Separate pass for memory, since tracing slows everything down
+        sink = replay.ReplySink()
+        submissions = list(replay.generate_submissions(
+            posts, sink, keyword_rate, text_length, keywords=keywords, seed=seed + 1))
+        tracemalloc.start()
+        replay.run_replay(submissions, sink)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    results['peak_memory_kb'] = peak / 1024
+    results.update(templates=template_count, keywords=keywords_per_template, text_length=text_length)
+    return results
+
+def parse_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the bot matching pipeline offline.')
+    parser.add_argument('--posts', type=int, default=2000, help='posts per case')
+    parser.add_argument('--templates', type=parse_list, default=[4, 50, 200])
+    parser.add_argument('--keywords', type=parse_list, default=[10, 50],
+                        help='keywords per template')
+    parser.add_argument('--text-lengths', type=parse_list, default=[200, 2000])
+    parser.add_argument('--keyword-rate', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    # Per-post log lines would dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+
+    header = (f"{'templates':>9} {'keywords':>8} {'text':>6} {'posts/s':>9} "
+              f"{'p50 ms':>8} {'p99 ms':>8} {'peak KB':>9} {'matched':>8}")
+    print(header)
+    print('-' * len(header))
+    for template_count in args.templates:
+        for keyword_count in args.keywords:
+            for text_length in args.text_lengths:
+                r = run_case(template_count, keyword_count, text_length, args.posts, args.keyword_rate)
+                print(f"{r['templates']:>9} {r['keywords']:>8} {r['text_length']:>6} "
+                      f"{r['posts_per_second']:>9.1f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} "
+                      f"{r['peak_memory_kb']:>9.0f} {r['matched']:>8}")
+
+if __name__ == "__main__":
+    sys.exit(main())
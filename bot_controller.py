@@ -0,0 +1,126 @@
+"""
+Bot Controller for Reddit Bot
+Runs the bot in a background thread with start, stop, pause and resume, so the
+web interface can manage it without restarting the server
+"""
+import time
+import logging
+import threading
+import reddit_bot
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Bot states, shown as-is on the dashboard
+STOPPED = "Stopped"
+STARTING = "Starting"
+RUNNING = "Running"
+PAUSED = "Paused"
+STOPPING = "Stopping"
+
+class BotController:
+    """Owns the bot thread and its stop and pause signals."""
+
+    def __init__(self, status_callback=None, state_callback=None):
+        self.status_callback = status_callback
+        self.state_callback = state_callback
+        self.state = STOPPED
+        self.error = None
+        self.started_at = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._pause_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.state in (STARTING, RUNNING, PAUSED, STOPPING)
+
+    def _set_state(self, state):
+        self.state = state
+        logger.info(f"Bot state: {state}")
+        if self.state_callback:
+            self.state_callback(state)
+
+    def _report(self, action):
+        if self.status_callback:
+            self.status_callback(action)
+
+    def start(self):
+        """Start the bot thread. Returns False if it is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop_event = threading.Event()
+            self._pause_event = threading.Event()
+            self.error = None
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name='reddit-bot', daemon=True)
+            self._set_state(STARTING)
+            self._thread.start()
+            return True
+
+    def stop(self, wait=False, timeout=None):
+        """Ask the bot to stop; it drains or saves queued replies on the way out."""
+        with self._lock:
+            if not self.running or self.state == STOPPING:
+                return False
+            self._set_state(STOPPING)
+            self._pause_event.clear()
+            self._stop_event.set()
+            thread = self._thread
+        if wait and thread:
+            thread.join(timeout)
+        return True
+
+    def pause(self):
+        """Stop taking new posts and sending replies until resumed."""
+        with self._lock:
+            if self.state != RUNNING:
+                return False
+            self._pause_event.set()
+            self._set_state(PAUSED)
+            return True
+
+    def resume(self):
+        with self._lock:
+            if self.state != PAUSED:
+                return False
+            self._pause_event.clear()
+            self._set_state(RUNNING)
+            return True
+
+    def status(self):
+        """Return the controller state for the dashboard."""
+        state = self.state
+        if self.error and state == STOPPED:
+            state = f"Error: {self.error}"
+        return {
+            'state': state,
+            'running': self.running,
+            'paused': self.state == PAUSED,
+            'started_at': self.started_at if self.running else None
+        }
+
+    def _run(self):
+        self._report("Starting bot...")
+        try:
+            with self._lock:
+                if not self._stop_event.is_set():
+                    self._set_state(RUNNING)
+            reddit_bot.run_bot(status_callback=self.status_callback,
+                               stop_event=self._stop_event,
+                               pause_event=self._pause_event)
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"Bot error: {e}")
+        finally:
+            with self._lock:
+                self.started_at = None
+                self._set_state(STOPPED)
+            self._report("Bot stopped")
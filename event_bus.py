@@ -0,0 +1,103 @@
+"""
+Event Bus for Reddit Bot
+In-process publish/subscribe channel used to push bot status changes, new
+replies and rate limit waits to the web dashboard as they happen
+"""
+import time
+import itertools
+import threading
+from collections import OrderedDict
+
+# Event types where only the latest value matters; bursts collapse to one event
+COALESCED_EVENTS = {'status', 'rate_limit', 'metrics'}
+
+# How long a subscriber waits for more events before delivering a batch, in seconds
+COALESCE_WINDOW = 0.5
+
+# Most undelivered events kept per subscriber; the oldest are dropped beyond this
+MAX_PENDING_EVENTS = 100
+
+class Subscription:
+    """A subscriber's queue of pending events."""
+
+    def __init__(self, bus, coalesce_window=COALESCE_WINDOW, max_pending=MAX_PENDING_EVENTS):
+        self._bus = bus
+        self._coalesce_window = coalesce_window
+        self._max_pending = max_pending
+        self._pending = OrderedDict()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.closed = False
+
+    def push(self, event_type, data):
+        with self._condition:
+            if event_type in COALESCED_EVENTS:
+                # Replace any undelivered event of the same type, moving it to the end
+                self._pending.pop(event_type, None)
+                self._pending[event_type] = (event_type, data)
+            else:
+                self._pending[(event_type, next(self._sequence))] = (event_type, data)
+            while len(self._pending) > self._max_pending:
+                self._pending.popitem(last=False)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Wait for events and return them as a list of (event_type, data) pairs.
+
+        Once the first event arrives, events published during the coalescing
+        window are delivered with it. Returns an empty list on timeout.
+        """
+        with self._condition:
+            if not self._pending and not self.closed:
+                self._condition.wait(timeout)
+            if not self._pending:
+                return []
+            deadline = time.monotonic() + self._coalesce_window
+            while not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            events = list(self._pending.values())
+            self._pending.clear()
+            return events
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self._bus.unsubscribe(self)
+
+class EventBus:
+    """Fans published events out to every subscriber."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, **kwargs):
+        subscription = Subscription(self, **kwargs)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type, data=None):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(event_type, data)
+
+# Shared bus for the whole process
+bus = EventBus()
+
+def publish(event_type, data=None):
+    """Publish an event on the shared bus."""
+    bus.publish(event_type, data)
+
+def subscribe(**kwargs):
+    """Subscribe to the shared bus."""
+    return bus.subscribe(**kwargs)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Fake Reddit for Reddit Bot
+A local stand-in for the parts of praw.Reddit the bot uses. It emits synthetic
+submissions at a configurable rate, adds latency, injects RATELIMIT errors and
+records replies, so the whole bot can be load tested on one machine.
+
+Select it with REDDIT_CLIENT_FACTORY = 'fake_reddit.create_fake_reddit' in
+config.py and tune it with the FAKE_REDDIT settings dictionary.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import logging
+import tempfile
+import threading
+import itertools
+from types import SimpleNamespace
+import config
+import message_templates
+import post_history
+import replay
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'submissions_per_second': 5.0,   # Rate new submissions appear across all subreddits
+    'subreddits': None,              # Subreddits to post in; defaults to every one streamed
+    'keyword_rate': 0.2,             # Fraction of submissions containing a template keyword
+    'text_length': 500,              # Approximate selftext length in characters
+    'latency_ms': 50,                # Added to every API call
+    'ratelimit_probability': 0.05,   # Chance a reply fails with RATELIMIT
+    'ratelimit_seconds': 30,         # Wait reported by injected RATELIMIT errors
+    'removal_probability': 0.02,     # Chance a reply is later found removed by moderators
+    'fetch_interval': 1.0,           # Seconds between stream polls
+    'seed': None
+}
+
+class FakeRateLimitError(Exception):
+    """Raised by replies in the same text format as praw's RATELIMIT API errors."""
+
+    def __init__(self, seconds):
+        super().__init__(
+            "RATELIMIT: \"Looks like you've been doing that a lot. Take a break for "
+            f"{seconds} seconds before trying again.\" on field 'ratelimit'"
+        )
+        self.seconds = seconds
+
+class FakeComment:
+    def __init__(self, id, author, body, submission):
+        self.id = id
+        self.author = SimpleNamespace(name=author)
+        self.body = body
+        self.submission = submission
+        self.score = 1
+        self.removed = False
+        self.created_utc = time.time()
+
+    @property
+    def fullname(self):
+        return f"t1_{self.id}"
+
+class FakeCommentForest:
+    def __init__(self, submission):
+        self._submission = submission
+
+    def replace_more(self, limit=None):
+        self._submission._reddit._delay()
+        return []
+
+    def list(self):
+        return list(self._submission.replies)
+
+class FakeSubmission:
+    def __init__(self, reddit, id, subreddit, title, selftext):
+        self._reddit = reddit
+        self.id = id
+        self.subreddit = SimpleNamespace(display_name=subreddit)
+        self.title = title
+        self.selftext = selftext
+        self.created_utc = time.time()
+        self.replies = []
+        self.comments = FakeCommentForest(self)
+
+    @property
+    def fullname(self):
+        return f"t3_{self.id}"
+
+    def reply(self, body):
+        return self._reddit._reply(self, body)
+
+class FakeSubredditStream:
+    def __init__(self, subreddit):
+        self._subreddit = subreddit
+
+    def submissions(self, skip_existing=False, pause_after=None):
+        """Yield new submissions like praw's stream, including None after quiet polls."""
+        reddit = self._subreddit._reddit
+        names = self._subreddit.names
+        position = len(reddit._submissions) if skip_existing else 0
+        quiet_polls = 0
+        while True:
+            reddit._delay()
+            with reddit._lock:
+                new = reddit._submissions[position:]
+                position += len(new)
+            found = False
+            for submission in new:
+                if submission.subreddit.display_name.lower() in names:
+                    found = True
+                    yield submission
+            if found:
+                quiet_polls = 0
+            else:
+                quiet_polls += 1
+                if pause_after is not None and quiet_polls > pause_after:
+                    quiet_polls = 0
+                    yield None
+            time.sleep(reddit.settings['fetch_interval'])
+
+class FakeSubreddit:
+    def __init__(self, reddit, display_name):
+        self._reddit = reddit
+        self.display_name = display_name
+        self.names = {name.lower() for name in display_name.split('+')}
+        self.stream = FakeSubredditStream(self)
+        reddit._register_subreddits(self.names)
+
+    def new(self, limit=100, params=None):
+        """Return the newest submissions like praw's listing, paged with params={'after': fullname}."""
+        reddit = self._reddit
+        reddit._delay()
+        after = (params or {}).get('after')
+        with reddit._lock:
+            submissions = [submission for submission in reversed(reddit._submissions)
+                           if submission.subreddit.display_name.lower() in self.names]
+        if after:
+            fullnames = [submission.fullname for submission in submissions]
+            submissions = submissions[fullnames.index(after) + 1:] if after in fullnames else []
+        return iter(submissions[:limit])
+
+class FakeUser:
+    def __init__(self, reddit):
+        self._reddit = reddit
+
+    def me(self):
+        self._reddit._delay()
+        return SimpleNamespace(name=self._reddit.username)
+
+class FakeAccountSubmission:
+    """A submission as seen by another account, so replies are posted as that account."""
+
+    def __init__(self, account, submission):
+        self._account = account
+        self._submission = submission
+
+    def __getattr__(self, name):
+        return getattr(self._submission, name)
+
+    def reply(self, body):
+        return self._account._reddit._reply(self._submission, body, self._account.username)
+
+class FakeAccount:
+    """Another user logged in to the same FakeReddit."""
+
+    def __init__(self, reddit, username):
+        self._reddit = reddit
+        self.username = username
+        self.user = FakeUser(self)
+
+    def _delay(self):
+        self._reddit._delay()
+
+    def submission(self, id):
+        return FakeAccountSubmission(self, self._reddit.submission(id))
+
+class FakeReddit:
+    """In-process replacement for praw.Reddit."""
+
+    def __init__(self, username='fake-bot', **settings):
+        self.username = username
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings)
+        self.user = FakeUser(self)
+        self._rng = random.Random(self.settings['seed'])
+        self._lock = threading.Lock()
+        self._submissions = []
+        self._submissions_by_id = {}
+        self._comments_by_id = {}
+        self._known_subreddits = set()
+        self._ids = itertools.count(1)
+        self._stop = threading.Event()
+        self.stats = {
+            'submissions': 0,
+            'replies': 0,
+            'ratelimited': 0,
+            'api_calls': 0
+        }
+        self._generator = threading.Thread(target=self._generate, name='fake-reddit', daemon=True)
+        self._generator.start()
+
+    def close(self):
+        self._stop.set()
+
+    def subreddit(self, display_name):
+        return FakeSubreddit(self, display_name)
+
+    def submission(self, id):
+        with self._lock:
+            return self._submissions_by_id[id]
+
+    def info(self, fullnames=None):
+        """Return the known comments among the fullnames, like praw's bulk lookup.
+
+        Each lookup nudges the scores and removes the odd reply, so tracking has something to see.
+        """
+        self._delay()
+        found = []
+        with self._lock:
+            for fullname in fullnames or []:
+                comment = self._comments_by_id.get(fullname.split('_', 1)[-1])
+                if comment is None:
+                    continue
+                comment.score += self._rng.choice((-1, 0, 0, 1, 2))
+                if self._rng.random() < self.settings['removal_probability']:
+                    comment.removed = True
+                    comment.body = '[removed]'
+                found.append(comment)
+        return iter(found)
+
+    def for_user(self, username):
+        """Log another account in to this fake Reddit."""
+        return FakeAccount(self, username)
+
+    def login(self, account=None):
+        """Client factory bound to this instance: the main account gets it, others log in to it."""
+        username = (account or {}).get('username')
+        if not username or username == self.username:
+            return self
+        return self.for_user(username)
+
+    def _register_subreddits(self, names):
+        with self._lock:
+            self._known_subreddits.update(names)
+
+    def _delay(self):
+        self.stats['api_calls'] += 1
+        latency = self.settings['latency_ms']
+        if latency:
+            time.sleep(latency / 1000.0)
+
+    def _reply(self, submission, body, username=None):
+        self._delay()
+        with self._lock:
+            if self._rng.random() < self.settings['ratelimit_probability']:
+                self.stats['ratelimited'] += 1
+                raise FakeRateLimitError(self.settings['ratelimit_seconds'])
+            comment = FakeComment(f"c{next(self._ids)}", username or self.username, body, submission)
+            submission.replies.append(comment)
+            self._comments_by_id[comment.id] = comment
+            self.stats['replies'] += 1
+        return comment
+
+    def _generate(self):
+        """Emit submissions at the configured rate until closed."""
+        keywords = message_templates.get_all_keywords()
+        rate = self.settings['submissions_per_second']
+        interval = 1.0 / rate if rate > 0 else None
+        while interval and not self._stop.wait(interval):
+            with self._lock:
+                subreddits = self.settings['subreddits'] or sorted(self._known_subreddits)
+                if not subreddits:
+                    continue
+                submission = FakeSubmission(
+                    self,
+                    id=f"f{next(self._ids)}",
+                    subreddit=self._rng.choice(subreddits),
+                    title=' '.join(self._rng.choice(replay.FILLER_WORDS) for _ in range(8)),
+                    selftext=replay.generate_text(
+                        self._rng, self.settings['text_length'], keywords, self.settings['keyword_rate'])
+                )
+                self._submissions.append(submission)
+                self._submissions_by_id[submission.id] = submission
+                self.stats['submissions'] += 1
+
+# The instance every account logs in to through create_fake_reddit
+_shared = None
+_shared_lock = threading.Lock()
+
+def create_fake_reddit(account=None):
+    """Client factory for REDDIT_CLIENT_FACTORY = 'fake_reddit.create_fake_reddit'.
+
+    All accounts log in to one FakeReddit per process, built from the
+    FAKE_REDDIT settings in config.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = FakeReddit(username=getattr(config, 'USERNAME', 'fake-bot'),
+                                 **getattr(config, 'FAKE_REDDIT', {}))
+    return _shared.login(account)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the bot against a local fake Reddit.')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run')
+    parser.add_argument('--rate', type=float, help='submissions per second')
+    parser.add_argument('--ratelimit-probability', type=float)
+    parser.add_argument('--latency-ms', type=float)
+    args = parser.parse_args(argv)
+
+    import reddit_bot
+    import reply_dispatcher
+
+    settings = dict(getattr(config, 'FAKE_REDDIT', {}))
+    for key in ('rate', 'ratelimit_probability', 'latency_ms'):
+        if getattr(args, key) is not None:
+            settings['submissions_per_second' if key == 'rate' else key] = getattr(args, key)
+    reddit = FakeReddit(username=getattr(config, 'USERNAME', 'fake-bot'), **settings)
+    # The extra ACCOUNTS log in to the same fake Reddit
+    reddit_bot.set_client_factory(reddit.login)
+
+    # Run in a scratch directory so the real history and indexes are untouched
+    work_dir = tempfile.mkdtemp(prefix='fake-reddit-')
+    for name in ('subreddit_config.json', 'templates.db'):
+        if os.path.exists(name):
+            shutil.copy(name, work_dir)
+    os.chdir(work_dir)
+    post_history.use_database('post_history.db')
+
+    stop_event = threading.Event()
+    bot = threading.Thread(target=reddit_bot.monitor_subreddits, args=(reddit,),
+                           kwargs={'stop_event': stop_event}, name='reddit-bot')
+    bot.start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Stopping drains queued replies, saves the rest and flushes history
+        stop_event.set()
+        bot.join()
+        reddit.close()
+        post_history.flush()
+
+    unsent = 0
+    if os.path.exists(reply_dispatcher.PENDING_REPLIES_FILE):
+        with open(reply_dispatcher.PENDING_REPLIES_FILE, 'r') as f:
+            unsent = len(json.load(f))
+
+    print(f"\nRan for {args.duration:.0f} seconds in {work_dir}")
+    for key, value in reddit.stats.items():
+        print(f"  {key}: {value}")
+    print(f"  recorded in history: {post_history.get_post_count()}")
+    print(f"  left unsent: {unsent}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Historical Scan for Reddit Bot
+Looks back through the recent posts of chosen subreddits for ones the bot
+would answer now, e.g. after adding a template or a subreddit, and either
+lists them ranked or queues replies under the normal rate limits
+
+Progress is saved after every page, so a long scan can be stopped and the
+same command run again to continue where it left off.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import config
+import account_pool
+import matching_stage
+import message_templates
+import post_history
+import reddit_bot
+import reply_check
+import reply_dispatcher
+import subreddit_manager
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# File the scan cursors and candidates are saved to between pages
+SCAN_STATE_FILE = 'history_scan.json'
+
+# Posts fetched per listing request (Reddit's maximum)
+SCAN_PAGE_SIZE = 100
+
+# Pages read per subreddit; Reddit listings stop at about 1000 posts
+SCAN_MAX_PAGES = 10
+
+# Posts older than this are not considered, in days
+SCAN_MAX_AGE_DAYS = getattr(config, 'HISTORY_SCAN_MAX_DAYS', 7)
+
+def new_state(subreddits, templates, max_age_days):
+    return {
+        'subreddits': {subreddit: {'after': None, 'pages': 0, 'scanned': 0, 'done': False}
+                       for subreddit in subreddits},
+        'templates': sorted(templates) if templates else None,
+        'max_age_days': max_age_days,
+        'started_at': time.time(),
+        'candidates': []
+    }
+
+def load_state(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_state(state, path):
+    """Write the scan state atomically, so an interrupted scan never leaves it half written."""
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_file, path)
+
+def rank_candidates(candidates):
+    """Order candidates by keyword hits, then newest first."""
+    return sorted(candidates, key=lambda candidate: (candidate['keyword_hits'], candidate['created_utc']),
+                  reverse=True)
+
+def scan_cutoff(state):
+    """Creation time of the oldest post the scan considers."""
+    return state['started_at'] - state['max_age_days'] * 86400
+
+def _candidate(post, template):
+    return {
+        'post_id': post.id,
+        'subreddit': post.subreddit.display_name,
+        'title': post.title,
+        'created_utc': post.created_utc,
+        'template': template['name'],
+        'keyword_hits': message_templates.count_template_matches(
+            matching_stage.post_text(post)).get(template['name'], 0),
+        'permalink': getattr(post, 'permalink', None)
+    }
+
+def _can_reply(post, known_ids):
+    return not (post.id in known_ids or getattr(post, 'locked', False) or getattr(post, 'archived', False)
+                or post_history.has_post(post.id))
+
+def scan(reddit, state, state_path=SCAN_STATE_FILE, max_pages=SCAN_MAX_PAGES):
+    """Walk each subreddit's newest posts from its saved cursor, collecting candidates.
+
+    The state is saved after every page. Returns the state.
+    """
+    matching = matching_stage.MatchingStage()
+    templates = set(state['templates']) if state['templates'] else None
+    cutoff = scan_cutoff(state)
+    known_ids = {candidate['post_id'] for candidate in state['candidates']}
+
+    try:
+        for subreddit, cursor in state['subreddits'].items():
+            while not cursor['done']:
+                params = {'after': cursor['after']} if cursor['after'] else None
+                page = list(reddit.subreddit(subreddit).new(limit=SCAN_PAGE_SIZE, params=params))
+                recent = [post for post in page if post.created_utc >= cutoff]
+
+                # Match the whole page at once so pooled matching runs it in parallel
+                for post in recent:
+                    if _can_reply(post, known_ids):
+                        matching.submit(post)
+                found = 0
+                while matching.pending:
+                    for post, template in matching.completed(block=True):
+                        if template and (templates is None or template['name'] in templates):
+                            state['candidates'].append(_candidate(post, template))
+                            known_ids.add(post.id)
+                            found += 1
+
+                cursor['pages'] += 1
+                cursor['scanned'] += len(page)
+                cursor['after'] = page[-1].fullname if page else cursor['after']
+                cursor['done'] = (len(page) < SCAN_PAGE_SIZE or len(recent) < len(page)
+                                  or cursor['pages'] >= max_pages)
+                save_state(state, state_path)
+                logger.info(f"r/{subreddit}: page {cursor['pages']}, {cursor['scanned']} posts scanned, "
+                            f"{found} new candidates ({len(state['candidates'])} in total)")
+    finally:
+        matching.close()
+    return state
+
+def queue_replies(reddit, candidates, max_age):
+    """Reply to the candidates through the accounts and rate limits the bot uses.
+
+    Replies are kept for posts up to `max_age` seconds old rather than the
+    bot's REPLY_MAX_AGE, which would drop most of a scan. Waits for the
+    replies to go out; any still queued when interrupted are handed over to
+    the bot, with that age limit, which picks them up while running or on
+    its next start. Returns the candidates whose replies were queued.
+    """
+    pool = account_pool.create_account_pool(reddit)
+    reply_checker = reply_check.ReplyChecker(
+        [reddit.user.me().name] + [account.username for account in pool.accounts[1:]])
+    dispatcher = reply_dispatcher.ReplyDispatcher(pool, max_age=max_age)
+    dispatcher.start()
+
+    queued = []
+    try:
+        for candidate in candidates:
+            template = message_templates.get_template(candidate['template'])
+            post = reddit.submission(id=candidate['post_id'])
+            # Checks history and the comment tree, since an earlier run may have replied
+            if reddit_bot.handle_match(post, template, dispatcher, reply_checker):
+                queued.append(candidate)
+        logger.info(f"Queued {len(queued)} replies, sending under the configured rate limits")
+        dispatcher.drain(float('inf'))
+    except KeyboardInterrupt:
+        logger.info("Interrupted, keeping unsent replies for the bot's next start")
+    finally:
+        dispatcher.stop()
+        # A file of our own, since a running bot rewrites its pending replies file
+        dispatcher.save_pending(reply_dispatcher.handoff_file())
+        post_history.flush()
+    return queued
+
+def print_candidates(candidates, limit):
+    print(f"{'hits':>4}  {'posted':<16}  {'subreddit':<20}  {'template':<20}  title")
+    for candidate in candidates[:limit]:
+        posted = time.strftime('%Y-%m-%d %H:%M', time.localtime(candidate['created_utc']))
+        print(f"{candidate['keyword_hits']:>4}  {posted:<16}  {'r/' + candidate['subreddit']:<20}  "
+              f"{candidate['template']:<20}  {candidate['title'][:60]}")
+    if len(candidates) > limit:
+        print(f"... and {len(candidates) - limit} more")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Find recent posts the bot would answer now, e.g. after adding a template or subreddit.')
+    parser.add_argument('--subreddits', help='comma-separated subreddits to scan (default: all enabled)')
+    parser.add_argument('--template', action='append',
+                        help='only keep posts answered by this template; may be repeated')
+    parser.add_argument('--days', type=float, default=SCAN_MAX_AGE_DAYS, help='how far back to look')
+    parser.add_argument('--pages', type=int, default=SCAN_MAX_PAGES,
+                        help=f'pages of {SCAN_PAGE_SIZE} posts to read per subreddit')
+    parser.add_argument('--state', default=SCAN_STATE_FILE, help='where progress is saved')
+    parser.add_argument('--restart', action='store_true', help='discard saved progress and start over')
+    parser.add_argument('--output', help='write the ranked candidates to this JSON-lines file')
+    parser.add_argument('--show', type=int, default=25, help='number of candidates to print')
+    parser.add_argument('--reply', action='store_true', help='reply to the candidates instead of only listing them')
+    parser.add_argument('--max-replies', type=int, help='reply to at most this many of the top candidates')
+    args = parser.parse_args(argv)
+
+    if args.subreddits:
+        subreddits = [subreddit.strip() for subreddit in args.subreddits.split(',') if subreddit.strip()]
+    else:
+        subreddits = subreddit_manager.get_active_subreddits()
+    for name in args.template or []:
+        if not message_templates.get_template(name):
+            print(f"Unknown template '{name}'", file=sys.stderr)
+            return 1
+
+    state = None if args.restart else load_state(args.state)
+    requested = new_state(subreddits, args.template, args.days)
+    if state is not None and (sorted(state['subreddits']) != sorted(requested['subreddits'])
+                              or state['templates'] != requested['templates']):
+        print(f"{args.state} holds a scan with different subreddits or templates; "
+              "use --restart to replace it or --state for a separate scan", file=sys.stderr)
+        return 1
+    if state is None:
+        state = requested
+    elif any(not cursor['done'] for cursor in state['subreddits'].values()):
+        logger.info(f"Resuming scan saved in {args.state}")
+
+    reddit = reddit_bot.create_reddit_instance()
+    if not reddit:
+        return 1
+
+    try:
+        scan(reddit, state, args.state, args.pages)
+    except KeyboardInterrupt:
+        print(f"\nScan interrupted; run the same command again to continue from {args.state}")
+        return 1
+
+    candidates = rank_candidates(state['candidates'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            for candidate in candidates:
+                f.write(json.dumps(candidate) + '\n')
+    print_candidates(candidates, args.show)
+
+    if args.reply:
+        # Old enough to cover every candidate the scan kept
+        queued = queue_replies(reddit, candidates[:args.max_replies], time.time() - scan_cutoff(state))
+        print(f"\nQueued {len(queued)} replies")
+        # Replied posts are in history now, so a later scan skips them anyway
+        queued_ids = {candidate['post_id'] for candidate in queued}
+        state['candidates'] = [candidate for candidate in candidates if candidate['post_id'] not in queued_ids]
+        save_state(state, args.state)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -39,12 +39,13 @@ def print_header():
 def list_templates():
     """Display all available message templates."""
     print_header()
-    print(f"AVAILABLE MESSAGE TEMPLATES ({len(message_templates.TEMPLATES)})\n")
+    templates = message_templates.get_all_templates()
+    print(f"AVAILABLE MESSAGE TEMPLATES ({len(templates)})\n")
     
-    for i, (name, info) in enumerate(message_templates.TEMPLATES.items(), 1):
-        print(f"{i}. {name.upper()} - {info['description']}")
+    for i, info in enumerate(templates, 1):
+        print(f"{i}. {info['name'].upper()} - {info['description']}")
         print(f"   Keywords: {', '.join(info['keywords'][:3])}{'...' if len(info['keywords']) > 3 else ''}")
-        print(f"   Response: {info['template'].strip().split(chr(10))[0][:60]}...")
+        print(f"   Response: {info['message'].strip().split(chr(10))[0][:60]}...")
         print()
     
     input("\nPress Enter to return to the main menu...")
@@ -56,9 +57,9 @@ def view_template():
         print("VIEW TEMPLATE\n")
         
         # List templates with numbers
-        templates = list(message_templates.TEMPLATES.items())
-        for i, (name, info) in enumerate(templates, 1):
-            print(f"{i}. {name} - {info['description']}")
+        templates = message_templates.get_all_templates()
+        for i, info in enumerate(templates, 1):
+            print(f"{i}. {info['name']} - {info['description']}")
         
         print("\n0. Back to main menu")
         
@@ -69,10 +70,10 @@ def view_template():
                 return
             
             if 1 <= choice <= len(templates):
-                name, info = templates[choice-1]
+                info = templates[choice-1]
                 
                 print_header()
-                print(f"TEMPLATE: {name.upper()}\n")
+                print(f"TEMPLATE: {info['name'].upper()}\n")
                 print(f"Description: {info['description']}")
                 print("\nKEYWORDS:")
                 
@@ -84,7 +85,7 @@ def view_template():
                 
                 print("\nRESPONSE TEMPLATE:")
                 print("-" * 70)
-                print(info['template'])
+                print(info['message'])
                 print("-" * 70)
                 
                 input("\nPress Enter to continue...")
@@ -96,6 +97,17 @@ def view_template():
             print("\nPlease enter a number.")
             time.sleep(1)
 
+def read_message():
+    """Read a multi-line message, ending at a line containing only a full stop."""
+    print("Enter the message. Finish with a line containing only '.':")
+    lines = []
+    while True:
+        line = input()
+        if line == '.':
+            break
+        lines.append(line)
+    return '\n'.join(lines)
+
 def edit_template():
     """Edit an existing template."""
     while True:
@@ -103,9 +115,9 @@ def edit_template():
         print("EDIT TEMPLATE\n")
         
         # List templates with numbers
-        templates = list(message_templates.TEMPLATES.items())
-        for i, (name, info) in enumerate(templates, 1):
-            print(f"{i}. {name} - {info['description']}")
+        templates = message_templates.get_all_templates()
+        for i, info in enumerate(templates, 1):
+            print(f"{i}. {info['name']} - {info['description']}")
         
         print("\n0. Back to main menu")
         
@@ -116,7 +128,11 @@ def edit_template():
                 return
             
             if 1 <= choice <= len(templates):
-                name, info = templates[choice-1]
+                info = templates[choice-1]
+                name = info['name']
+                keywords = list(info['keywords'])
+                message = info['message']
+                description = info['description']
                 
                 print_header()
                 print(f"EDITING TEMPLATE: {name.upper()}\n")
@@ -133,17 +149,15 @@ def edit_template():
                     continue
                 elif sub_choice == 1:
                     # Edit description
-                    current = info['description']
-                    print(f"\nCurrent description: {current}")
+                    print(f"\nCurrent description: {description}")
                     new = input("Enter new description (or press Enter to keep current): ")
                     if new:
-                        # This would modify the template in memory
-                        # In a real implementation, this would save to a file
-                        print("\nDescription updated! (Note: Changes are not permanent in this demo)")
+                        message_templates.update_template(name, keywords, message, description=new)
+                        print("\nDescription updated!")
                 elif sub_choice == 2:
                     # Edit keywords
                     print("\nCurrent keywords:")
-                    for i, keyword in enumerate(info['keywords'], 1):
+                    for i, keyword in enumerate(keywords, 1):
                         print(f"{i}. {keyword}")
                     
                     print("\nOptions:")
@@ -153,21 +167,28 @@ def edit_template():
                     
                     kw_choice = int(input("\nEnter choice: "))
                     if kw_choice == 1:
-                        new_keyword = input("Enter new keyword: ")
+                        new_keyword = input("Enter new keyword: ").strip()
                         if new_keyword:
-                            print(f"\nKeyword '{new_keyword}' would be added. (Note: Changes are not permanent in this demo)")
+                            message_templates.update_template(name, keywords + [new_keyword], message)
+                            print(f"\nKeyword '{new_keyword}' added!")
                     elif kw_choice == 2:
                         kw_index = int(input("Enter keyword number to remove: ")) - 1
-                        if 0 <= kw_index < len(info['keywords']):
-                            print(f"\nKeyword '{info['keywords'][kw_index]}' would be removed. (Note: Changes are not permanent in this demo)")
+                        if 0 <= kw_index < len(keywords):
+                            removed = keywords.pop(kw_index)
+                            message_templates.update_template(name, keywords, message)
+                            print(f"\nKeyword '{removed}' removed!")
                 elif sub_choice == 3:
                     # Edit template text
                     print("\nCurrent template:")
                     print("-" * 70)
-                    print(info['template'])
+                    print(message)
                     print("-" * 70)
-                    print("\nTo edit the template, you would normally open it in a text editor.")
-                    print("In this demo, changes are not saved permanently.")
+                    new_message = read_message()
+                    if new_message.strip():
+                        message_templates.update_template(name, keywords, new_message)
+                        print("\nTemplate updated!")
+                    else:
+                        print("\nEmpty message, template left unchanged.")
                 
                 input("\nPress Enter to continue...")
             else:
@@ -183,15 +204,21 @@ def create_template():
     print_header()
     print("CREATE NEW TEMPLATE\n")
     
-    print("In a full implementation, this would allow you to create a new template.")
-    print("You would enter:")
-    print("1. Template name")
-    print("2. Description")
-    print("3. Keywords that trigger this template")
-    print("4. The response message template")
-    
-    print("\nTo actually create a new template, edit the message_templates.py file")
-    print("and add a new entry to the TEMPLATES dictionary.")
+    name = input("Template name: ").strip()
+    if not name:
+        print("\nNo name given, nothing created.")
+    elif message_templates.get_template(name):
+        print(f"\nA template called '{name}' already exists.")
+    else:
+        description = input("Description: ").strip()
+        keywords = [k.strip() for k in input("Keywords (comma separated): ").split(',') if k.strip()]
+        message = read_message()
+        if keywords and message.strip():
+            message_templates.add_template(name, keywords, message, description=description or None)
+            print(f"\nTemplate '{name}' created!")
+            print(f"To find recent posts it would answer, run: python history_scan.py --template \"{name}\"")
+        else:
+            print("\nA template needs at least one keyword and a message, nothing created.")
     
     input("\nPress Enter to return to the main menu...")
 
@@ -219,19 +246,26 @@ def run_bot():
         input("\nPress Enter to return to the main menu...")
 
 def test_bot():
-    """Run the bot test script."""
+    """Replay submissions through the bot pipeline without posting to Reddit."""
     print_header()
     print("TESTING BOT\n")
     
-    print("Running the test script to verify bot functionality...")
-    print("This will test Reddit connection and template matching without posting.")
+    print("Replays submissions through template matching, duplicate checks and")
+    print("history tracking. Replies are recorded locally instead of posted.")
     
-    input("\nPress Enter to start the test...")
+    path = input("\nJSON-lines file of submissions (or press Enter for synthetic posts): ").strip()
     
-    # Import and run the test script
+    # Import and run the replay harness
     try:
-        import test_bot
-        test_bot.main()
+        import replay
+        sink = replay.ReplySink()
+        if path:
+            submissions = list(replay.load_submissions(path, sink))
+        else:
+            submissions = list(replay.generate_submissions(200, sink))
+        
+        print()
+        replay.print_results(replay.run_replay(submissions, sink))
     except Exception as e:
         print(f"\nError running test: {e}")
     
@@ -359,6 +393,8 @@ def edit_category_subreddits(category_name):
             if new_sub:
                 if subreddit_manager.add_subreddit(category_name, new_sub):
                     print(f"Subreddit 'r/{new_sub}' added to {category_name}.")
+                    print(f"To find recent posts to answer there, run: python history_scan.py --subreddits {new_sub}")
+                    input("Press Enter to continue...")
                 else:
                     print(f"Failed to add subreddit 'r/{new_sub}'.")
                 time.sleep(1)
@@ -412,6 +448,17 @@ def view_post_history():
             print("\nPOSTS BY TEMPLATE:")
             for template, count in sorted(stats['templates'].items(), key=lambda x: x[1], reverse=True):
                 print(f"  {template}: {count} posts")
+            
+            # Display how the tracked replies are doing
+            health = post_history.get_reply_health()['templates']
+            if health:
+                print("\nREPLY HEALTH BY TEMPLATE:")
+                for template, outcome in sorted(health.items(), key=lambda x: x[1]['tracked'], reverse=True):
+                    line = (f"  {template}: {outcome['tracked']} tracked, {outcome['removed']} removed, "
+                            f"{outcome['deleted']} deleted, {outcome['downvoted']} downvoted")
+                    if outcome['average_score'] is not None:
+                        line += f", average score {outcome['average_score']:.1f}"
+                    print(line)
         
         print("\nACTIONS:")
         print("1. View Recent Posts")
@@ -434,7 +481,7 @@ def view_post_history():
                 view_filtered_posts(subreddit=subreddit)
         elif choice == '3':
             # Filter by Template
-            templates = list(message_templates.TEMPLATES.keys())
+            templates = [info['name'] for info in message_templates.get_all_templates()]
             print("\nAvailable Templates:")
             for i, template in enumerate(templates, 1):
                 print(f"{i}. {template}")
@@ -474,10 +521,10 @@ def view_recent_posts(limit=20):
     else:
         # Display posts
         for i, post in enumerate(posts, 1):
-            print(f"{i}. [{post['timestamp']}] r/{post['subreddit']}")
-            print(f"   Title: {post['title'][:60]}{'...' if len(post['title']) > 60 else ''}")
-            print(f"   Template: {post['template_used']}")
-            print(f"   URL: {post['url']}")
+            posted_at = datetime.fromtimestamp(post['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{i}. [{posted_at}] r/{post['subreddit']}")
+            print(f"   Template: {post['template_name']}")
+            print(f"   URL: https://reddit.com/{post['post_id']}")
             print()
     
     input("Press Enter to continue...")
@@ -497,10 +544,10 @@ def view_filtered_posts(subreddit=None, template=None):
     else:
         # Display posts
         for i, post in enumerate(posts, 1):
-            print(f"{i}. [{post['timestamp']}] r/{post['subreddit']}")
-            print(f"   Title: {post['title'][:60]}{'...' if len(post['title']) > 60 else ''}")
-            print(f"   Template: {post['template_used']}")
-            print(f"   URL: {post['url']}")
+            posted_at = datetime.fromtimestamp(post['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{i}. [{posted_at}] r/{post['subreddit']}")
+            print(f"   Template: {post['template_name']}")
+            print(f"   URL: https://reddit.com/{post['post_id']}")
             print()
     
     input("Press Enter to continue...")
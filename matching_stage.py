@@ -0,0 +1,167 @@
+"""
+Matching Stage for Reddit Bot
+Runs keyword matching for incoming posts inline, on a thread pool or on a
+process pool, and hands the results back in the order the posts arrived
+
+Pick the execution mode with MATCH_EXECUTION = 'inline', 'thread' or
+'process' in config.py. Process workers are started with forkserver, or
+spawn where that is unavailable, never forked from the multithreaded bot;
+each loads a copy of the templates and compiles the matcher on start.
+"""
+import os
+import time
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import config
+import message_templates
+import metrics
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Where matching runs: 'inline' (the stream thread), 'thread' or 'process'
+MATCH_EXECUTION = getattr(config, 'MATCH_EXECUTION', 'inline')
+
+# Worker threads or processes for the 'thread' and 'process' modes
+MATCH_WORKERS = getattr(config, 'MATCH_WORKERS', os.cpu_count() or 2)
+
+# Posts allowed in flight per worker before submitting waits on the oldest
+MAX_PENDING_PER_WORKER = 4
+
+MODES = ('inline', 'thread', 'process')
+
+def post_text(post):
+    """Return the text of a post that is matched against the templates."""
+    return post.title + ' ' + post.selftext
+
+def _init_worker(templates):
+    """Load the parent's templates into a worker process and compile the matcher."""
+    # Workers never read the store; the pool is replaced when templates change
+    message_templates.use_store(None)
+    message_templates.TEMPLATES = templates
+    message_templates.invalidate_templates()
+    message_templates.get_matcher()
+
+def _process_context():
+    """Prefer forkserver, which starts workers from a clean single-threaded server."""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+def _match(text):
+    # Only the name crosses back from a worker; the parent looks up the template
+    return message_templates.get_template_name_for_text(text)
+
+class MatchingStage:
+    """Matches posts concurrently while returning results in arrival order."""
+
+    def __init__(self, mode=MATCH_EXECUTION, workers=MATCH_WORKERS):
+        if mode not in MODES:
+            raise ValueError(f"Unknown MATCH_EXECUTION {mode!r}; use one of {', '.join(MODES)}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._pending = deque()
+        self._executor = None
+        self._templates_version = None
+        self.stats = {
+            'submitted': 0,
+            'matched': 0,
+            'errors': 0,
+            'pool_restarts': 0
+        }
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    @property
+    def full(self):
+        return self.mode != 'inline' and len(self._pending) >= self.workers * MAX_PENDING_PER_WORKER
+
+    def _get_executor(self):
+        """Return the worker pool, replacing process workers if the templates changed."""
+        version = message_templates.get_templates_version()
+        if self._executor is not None and (self.mode == 'thread' or version == self._templates_version):
+            return self._executor
+
+        if self._executor is not None:
+            # Posts already handed to the old workers still finish there
+            self._executor.shutdown(wait=False)
+            self.stats['pool_restarts'] += 1
+            logger.info("Templates changed, restarting matching workers")
+        self._templates_version = version
+
+        if self.mode == 'thread':
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='matcher')
+        else:
+            # Send the workers the registry's consistent copy of the templates
+            registry = message_templates.get_registry()
+            self._templates_version = registry.version
+            templates = {view['name']: {'keywords': list(view['keywords']),
+                                        'message': view['message'],
+                                        'description': view['description']}
+                         for view in registry.views}
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=_process_context(),
+                                                 initializer=_init_worker, initargs=(templates,))
+        return self._executor
+
+    def submit(self, post):
+        """Queue a post for matching."""
+        self.stats['submitted'] += 1
+        submitted = time.perf_counter()
+        if self.mode == 'inline':
+            future = Future()
+            try:
+                future.set_result(_match(post_text(post)))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self._get_executor().submit(_match, post_text(post))
+        self._pending.append((post, future, submitted))
+
+    def completed(self, block=False, timeout=None):
+        """Yield (post, template) for finished posts, stopping at the first unfinished one.
+
+        With `block` the oldest post is waited for first. `template` is None
+        for posts that matched nothing or could not be matched.
+        """
+        if block and self._pending:
+            wait([self._pending[0][1]], timeout=timeout, return_when=FIRST_COMPLETED)
+        while self._pending and self._pending[0][1].done():
+            post, future, submitted = self._pending.popleft()
+            # For pooled modes this includes the wait for a free worker
+            metrics.observe('match', time.perf_counter() - submitted)
+            try:
+                name = future.result()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Error matching post {post.id}: {e}")
+                name = None
+            template = message_templates.get_template(name) if name else None
+            if template:
+                self.stats['matched'] += 1
+                metrics.inc('posts_matched')
+            yield post, template
+
+    def close(self):
+        """Finish the posts in flight and shut the workers down.
+
+        Returns the remaining (post, template) results in arrival order.
+        """
+        results = []
+        while self._pending:
+            results.extend(self.completed(block=True))
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return results
+
+    def metrics(self):
+        return dict(self.stats, mode=self.mode, workers=self.workers, pending=len(self._pending))
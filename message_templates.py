@@ -1,6 +1,11 @@
 # Message Templates for Reddit Bot
 # This file contains different message templates and their associated keywords
 
+import time
+import threading
+from types import MappingProxyType
+import template_store
+
 # Template 1: General Activism Resources
 ACTIVISM_KEYWORDS = [
     'how to help', 'get involved', 'volunteer', 'organize', 
@@ -152,59 +157,267 @@ TEMPLATES = {
 
 # Functions for template management
 def get_all_templates():
-    """Get all available templates."""
-    return [{'name': name, 'keywords': data['keywords'], 'message': data['message']} 
-            for name, data in TEMPLATES.items()]
+    """Get all available templates.
+    
+    Returns the registry's shared read-only views; do not modify them.
+    """
+    return get_registry().views
 
 def get_template(template_name):
     """Get a specific template by name."""
-    if template_name in TEMPLATES:
-        return {
-            'name': template_name,
-            'keywords': TEMPLATES[template_name]['keywords'],
-            'message': TEMPLATES[template_name]['message']
-        }
-    return None
+    return get_registry().by_name.get(template_name)
+
+def get_template_count():
+    """Get the number of templates."""
+    return len(get_registry().views)
 
-def update_template(template_name, keywords, message):
-    """Update an existing template."""
+def update_template(template_name, keywords, message, description=None):
+    """Update an existing template and save it to the template store."""
+    _sync_from_store(force=True)
     if template_name in TEMPLATES:
-        TEMPLATES[template_name]['keywords'] = keywords
-        TEMPLATES[template_name]['message'] = message
+        _save_template(template_name, keywords, message,
+                       TEMPLATES[template_name].get('description', '') if description is None else description)
         return True
     return False
 
-def add_template(template_name, keywords, message):
-    """Add a new template."""
+def add_template(template_name, keywords, message, description=None):
+    """Add a new template and save it to the template store."""
+    _sync_from_store(force=True)
     if template_name not in TEMPLATES:
-        TEMPLATES[template_name] = {
-            'keywords': keywords,
-            'message': message,
-            'description': f'Custom template: {template_name}'
-        }
+        _save_template(template_name, keywords, message, description or f'Custom template: {template_name}')
         return True
     return False
 
+def get_all_keywords():
+    """Get a de-duplicated list of keywords across all templates."""
+    return list(get_matcher().keywords)
+
+# Keyword matcher
+# An Aho-Corasick automaton built once from TEMPLATES, so a post is scanned in a
+# single pass no matter how many templates and keywords are configured.
+class KeywordMatcher:
+    """Multi-pattern, case-insensitive substring matcher over template keywords."""
+
+    def __init__(self, templates):
+        self.keywords = []
+        # keyword index -> names of the templates that use it
+        self.owners = []
+        keyword_ids = {}
+        for name, data in templates.items():
+            for keyword in data['keywords']:
+                keyword = keyword.lower()
+                if not keyword:
+                    continue
+                if keyword not in keyword_ids:
+                    keyword_ids[keyword] = len(self.keywords)
+                    self.keywords.append(keyword)
+                    self.owners.append([])
+                owners = self.owners[keyword_ids[keyword]]
+                if name not in owners:
+                    owners.append(name)
+        self._build()
+
+    def _build(self):
+        """Build the goto, failure and output tables of the automaton."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(index)
+
+        # Breadth-first pass to compute failure links
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def find_keywords(self, text):
+        """Return the set of keyword indexes that occur in the text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+    def count_matches(self, text):
+        """Return the number of distinct keyword hits per template for the text."""
+        counts = {}
+        for index in self.find_keywords(text):
+            for name in self.owners[index]:
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+# Template registry
+# A read-only snapshot of TEMPLATES with lookup indexes and the views handed to
+# callers. It is built once and shared by reference until a template changes.
+class TemplateRegistry:
+    """Immutable, versioned view of the templates with a name index."""
+
+    def __init__(self, templates, version):
+        self.version = version
+        self.views = tuple(MappingProxyType({
+            'id': template_id,
+            'name': name,
+            'keywords': tuple(data['keywords']),
+            'message': data['message'],
+            'description': data.get('description', '')
+        }) for template_id, (name, data) in enumerate(templates.items()))
+        self.names = tuple(view['name'] for view in self.views)
+        self.by_name = MappingProxyType({view['name']: view for view in self.views})
+        self._matcher = None
+
+    @property
+    def matcher(self):
+        """The keyword matcher for this snapshot, compiled on first use."""
+        if self._matcher is None:
+            self._matcher = KeywordMatcher(self.by_name)
+        return self._matcher
+
+_registry = None
+
+# Bumped whenever templates change, so copies of the registry held elsewhere
+# (such as in matching worker processes) know to refresh
+_templates_version = 0
+
+def get_templates_version():
+    """Get a number that changes whenever the templates are edited."""
+    _sync_from_store()
+    return _templates_version
+
+def get_registry():
+    """Get the template registry, building it if templates changed."""
+    global _registry
+    _sync_from_store()
+    registry = _registry
+    if registry is None:
+        # Copy under the lock, since a store sync in another thread may be changing TEMPLATES
+        with _store_lock:
+            version = _templates_version
+            templates = dict(TEMPLATES)
+        registry = TemplateRegistry(templates, version)
+        with _store_lock:
+            # Keep it only if the templates did not change while it was built
+            if _templates_version == version:
+                _registry = registry
+    return registry
+
+def get_matcher():
+    """Get the compiled keyword matcher for the current templates."""
+    return get_registry().matcher
+
+def invalidate_templates():
+    """Discard the registry and matcher so they are rebuilt from TEMPLATES on next use."""
+    global _registry, _templates_version
+    with _store_lock:
+        _registry = None
+        _templates_version += 1
+
+# Template store
+# Templates are saved in a SQLite store so edits survive restarts and reach the
+# bot when they are made from the web interface or manager in another process.
+# The built-in TEMPLATES above seed the store the first time it is created.
+
+# Database the templates are saved in; None keeps them in memory only
+TEMPLATES_DB = template_store.TEMPLATES_DB
+
+# How often the store is checked for changes made by other processes, in seconds
+STORE_CHECK_INTERVAL = 1.0
+
+_store = None
+_store_version = 0
+_last_store_check = 0.0
+_store_lock = threading.RLock()
+
+def use_store(db_file):
+    """Switch to a different template store, or to in-memory templates with None."""
+    global TEMPLATES_DB, _store, _store_version, _last_store_check
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+        TEMPLATES_DB = db_file
+        _store = None
+        _store_version = 0
+        _last_store_check = 0.0
+        invalidate_templates()
+
+def _sync_from_store(force=False):
+    """Fold templates changed in the store, by this or another process, into TEMPLATES."""
+    global _store, _store_version, _last_store_check
+    if not TEMPLATES_DB:
+        return
+    now = time.monotonic()
+    if not force and _store is not None and now - _last_store_check < STORE_CHECK_INTERVAL:
+        return
+    with _store_lock:
+        _last_store_check = now
+        if _store is None:
+            _store = template_store.TemplateStore(TEMPLATES_DB, seed=TEMPLATES)
+        if _store.get_version() == _store_version:
+            return
+        version, changes = _store.changes_since(_store_version)
+        for name, data in changes.items():
+            TEMPLATES[name] = data
+        _store_version = version
+        invalidate_templates()
+
+def _save_template(template_name, keywords, message, description):
+    with _store_lock:
+        if not TEMPLATES_DB:
+            TEMPLATES[template_name] = {'keywords': keywords, 'message': message, 'description': description}
+            invalidate_templates()
+            return
+        _store.save(template_name, keywords, message, description)
+        _sync_from_store(force=True)
+
+def count_template_matches(text):
+    """Count keyword matches for each template in a single pass over the text."""
+    return get_matcher().count_matches(text)
+
 # Function to find the best template for a given text
+def _best_template_name(registry, text):
+    matches = registry.matcher.count_matches(text)
+    
+    # Find the template with the most matches, ties going to the first template
+    best_name = None
+    best_count = 0
+    for name in registry.names:
+        count = matches.get(name, 0)
+        if count > best_count:
+            best_name = name
+            best_count = count
+    return best_name
+
+def get_template_name_for_text(text):
+    """Find the name of the best template for the text, or None if nothing matches."""
+    return _best_template_name(get_registry(), text)
+
 def get_template_for_text(text):
     """Find the best template based on keyword matches in the text."""
-    text = text.lower()
-    
-    # Count keyword matches for each template
-    matches = {}
-    for name, data in TEMPLATES.items():
-        matches[name] = sum(1 for keyword in data['keywords'] if keyword.lower() in text)
+    registry = get_registry()
+    best_name = _best_template_name(registry, text)
     
-    # Find the template with the most matches
-    if matches:
-        best_template = max(matches.items(), key=lambda x: x[1])
-        
-        # Only return a template if there's at least one match
-        if best_template[1] > 0:
-            template_name = best_template[0]
-            return {
-                'name': template_name,
-                'message': TEMPLATES[template_name]['message']
-            }
+    # Only return a template if there's at least one match
+    if best_name is not None:
+        return registry.by_name[best_name]
     
     return None
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Metrics for Reddit Bot
+Timing spans, histograms and counters for each stage of the pipeline, from
+a submission arriving on a stream to its reply being recorded, rendered in
+the Prometheus text format for the /metrics route
+
+Set METRICS_ENABLED = False in config.py to turn recording off; spans then
+cost a single attribute check.
+"""
+import sys
+import time
+import bisect
+import argparse
+import threading
+import urllib.request
+import config
+
+METRICS_ENABLED = getattr(config, 'METRICS_ENABLED', True)
+
+# Prefix for every exported metric name
+METRIC_PREFIX = 'redditbot'
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+# Where the CLI reads metrics from by default
+DEFAULT_METRICS_URL = 'http://127.0.0.1:5000/metrics'
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+class _Span:
+    """Times a block of code into a stage histogram."""
+
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+class _NoSpan:
+    """Stands in for a span while metrics are disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_collectors = {}
+
+def span(stage):
+    """Time a block under the given stage name: `with metrics.span('reply'): ...`"""
+    if not METRICS_ENABLED:
+        return _NO_SPAN
+    return _Span(stage)
+
+def observe(stage, seconds):
+    """Record a duration for a stage."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+def inc(name, amount=1):
+    """Add to a counter."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def register_collector(name, collect):
+    """Export the numbers returned by `collect()` as gauges each time metrics are read.
+
+    `collect` returns a dictionary; nested dictionaries become labelled series
+    and non-numeric values are skipped.
+    """
+    with _lock:
+        _collectors[name] = collect
+
+def snapshot():
+    """Return the histograms, counters and collector values as plain data."""
+    with _lock:
+        histograms = {stage: {
+            'buckets': list(zip(h.buckets, h.counts)),
+            'overflow': h.counts[-1],
+            'count': h.count,
+            'sum': h.sum,
+            'p50': h.quantile(0.5),
+            'p99': h.quantile(0.99)
+        } for stage, h in _histograms.items()}
+        counters = dict(_counters)
+        collectors = dict(_collectors)
+    gauges = {}
+    for name, collect in collectors.items():
+        try:
+            gauges[name] = collect()
+        except Exception as e:
+            gauges[name] = {'collector_error': str(e)}
+    return {'histograms': histograms, 'counters': counters, 'gauges': gauges}
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _metric_name(*parts):
+    name = '_'.join((METRIC_PREFIX,) + parts)
+    return ''.join(char if char.isalnum() or char == '_' else '_' for char in name).lower()
+
+def _gauge_lines(name, values, labels=''):
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if _is_number(value):
+            lines.append(f"{_metric_name(name, key)}{labels} {value}")
+        elif isinstance(value, dict) and not labels:
+            # One level of nesting, e.g. per-account or per-shard figures, as
+            # series of their own labelled with the singular of the key
+            # ('accounts' -> dispatcher_account_sent{account="..."}), so they
+            # never share a name with the collector's totals
+            label = key[:-1] if key.endswith('s') else key
+            for sub_key, sub_value in value.items():
+                if isinstance(sub_value, dict):
+                    lines.extend(_gauge_lines(f'{name}_{label}', sub_value,
+                                              f'{{{label}="{_label_value(sub_key)}"}}'))
+    return lines
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = []
+
+    if data['histograms']:
+        name = _metric_name('stage_duration_seconds')
+        lines.append(f"# HELP {name} Time spent in each pipeline stage.")
+        lines.append(f"# TYPE {name} histogram")
+        for stage, h in sorted(data['histograms'].items()):
+            stage_label = _label_value(stage)
+            cumulative = 0
+            for bound, count in h['buckets']:
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{stage_label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage_label}",le="+Inf"}} {h["count"]}')
+            lines.append(f'{name}_sum{{stage="{stage_label}"}} {h["sum"]}')
+            lines.append(f'{name}_count{{stage="{stage_label}"}} {h["count"]}')
+
+    for counter, value in sorted(data['counters'].items()):
+        name = _metric_name(counter, 'total')
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+
+    # Group the series by name so each gauge is declared once
+    gauges = {}
+    for collector, values in sorted(data['gauges'].items()):
+        for line in _gauge_lines(collector, values):
+            gauges.setdefault(line.split('{')[0].split(' ')[0], []).append(line)
+    for name, series in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(series)
+
+    return '\n'.join(lines) + '\n'
+
+def format_summary(data=None):
+    """Render a snapshot as a short table for the terminal."""
+    data = data or snapshot()
+    lines = [f"{'stage':<22} {'count':>8} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10}"]
+    lines.append('-' * len(lines[0]))
+    for stage, h in sorted(data['histograms'].items()):
+        mean = h['sum'] / h['count'] * 1000 if h['count'] else 0.0
+        lines.append(f"{stage:<22} {h['count']:>8} {mean:>10.3f} {h['p50'] * 1000:>10.3f} {h['p99'] * 1000:>10.3f}")
+    if data['counters']:
+        lines.append('')
+        for counter, value in sorted(data['counters'].items()):
+            lines.append(f"{counter:<22} {value:>8}")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print the metrics of a running bot.')
+    parser.add_argument('--url', default=DEFAULT_METRICS_URL, help='metrics route of the web interface')
+    args = parser.parse_args(argv)
+
+    try:
+        with urllib.request.urlopen(args.url, timeout=10) as response:
+            print(response.read().decode('utf-8'), end='')
+    except OSError as e:
+        print(f"Could not read metrics from {args.url}: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,30 @@
 """
 Post History Tracker for Reddit Bot
-Tracks where the bot has posted and stores the history in a JSON file
+Tracks where the bot has posted and stores the history in a SQLite database
+
+New posts are buffered and written in batches by a background thread, with a
+small journal file per process so buffered posts survive a crash; whichever
+process next opens the history replays the journals of crashed ones. Posts older than the
+retention window are moved into compressed monthly archive files whose
+totals are kept in the database, so the stats still cover them. The id of
+each reply comment is stored too, so reply_tracker can record how the reply
+fared.
 """
 import os
+import glob
+import gzip
+import fcntl
 import json
+import time
+import atexit
+import sqlite3
 import logging
+import threading
+from collections import deque
+from contextlib import closing
 from datetime import datetime
+import config
+import metrics
 
 # Set up logging
 logging.basicConfig(
@@ -15,129 +34,819 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# File to store post history
+# Database to store post history
+HISTORY_DB = 'post_history.db'
+
+# Legacy JSON history file, migrated into the database on first start
 HISTORY_FILE = 'post_history.json'
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id TEXT NOT NULL,
+    subreddit TEXT NOT NULL,
+    template_name TEXT,
+    timestamp INTEGER NOT NULL,
+    reply_id TEXT,
+    reply_score INTEGER,
+    reply_state TEXT,
+    reply_checked_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_posts_post_id ON posts (post_id);
+CREATE INDEX IF NOT EXISTS idx_posts_subreddit ON posts (subreddit COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_posts_template_name ON posts (template_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_posts_timestamp ON posts (timestamp);
+CREATE TABLE IF NOT EXISTS archive_segments (
+    month TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    post_count INTEGER NOT NULL,
+    first_timestamp INTEGER NOT NULL,
+    last_timestamp INTEGER NOT NULL,
+    subreddits TEXT NOT NULL,
+    templates TEXT NOT NULL
+);
+"""
+
+POST_COLUMNS = 'post_id, subreddit, template_name, timestamp, reply_id'
+
+# Columns added after the first release, created on databases that predate them
+ADDED_COLUMNS = {
+    'reply_id': 'TEXT',
+    'reply_score': 'INTEGER',
+    'reply_state': 'TEXT',
+    'reply_checked_at': 'INTEGER'
+}
+
+# Reply outcome columns, filled in by reply_tracker
+OUTCOME_COLUMNS = 'reply_score, reply_state, reply_checked_at'
+
+# Values of reply_state
+REPLY_LIVE = 'live'
+REPLY_REMOVED = 'removed'
+REPLY_DELETED = 'deleted'
+
+# Default number of posts per page of history
+HISTORY_PAGE_SIZE = 50
+
+# Number of most recent posts kept in memory for the dashboard
+RECENT_POSTS_SIZE = 50
+
+# Buffered posts are committed once this many are waiting or the oldest has
+# waited this many seconds, whichever comes first
+HISTORY_BATCH_SIZE = getattr(config, 'HISTORY_BATCH_SIZE', 50)
+HISTORY_FLUSH_SECONDS = getattr(config, 'HISTORY_FLUSH_SECONDS', 1.0)
+
+# Posts older than this many days are moved out of the database into archives
+HISTORY_RETENTION_DAYS = getattr(config, 'HISTORY_RETENTION_DAYS', 30)
+
+# Directory holding the compressed monthly archive segments
+ARCHIVE_DIR = getattr(config, 'HISTORY_ARCHIVE_DIR', 'history_archive')
+
+# A single connection shared by the bot and web threads, serialised by a lock
+_connection = None
+_lock = threading.RLock()
+
+# Running totals kept up to date on every write, rebuilt if another process writes
+_aggregates = None
+
+# Posts waiting for the background writer, and the journal they are appended to
+_buffer = []
+_buffer_started = None
+_buffer_condition = threading.Condition()
+_journal = None
+_writer = None
+
+# Held with an exclusive flock while this process has a journal, so other
+# processes recovering crashed journals leave a live one alone
+_journal_lock = None
+
+# The batch being committed, still counted as recorded until it lands
+_committing = []
+
+# Serialises batch commits so they land in order, and guards the connection
+# they are made on, which is separate so a commit never holds up _lock
+_flush_lock = threading.Lock()
+_writer_connection = None
+
+def _get_connection():
+    """Open the history database on first use and return the shared connection."""
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = sqlite3.connect(HISTORY_DB, check_same_thread=False)
+            _connection.row_factory = sqlite3.Row
+            _connection.execute('PRAGMA journal_mode=WAL')
+            # Batches are the unit of durability, so each commit is synced once
+            _connection.execute('PRAGMA synchronous=FULL')
+            _connection.executescript(SCHEMA)
+            _add_missing_columns(_connection)
+        return _connection
+
+def _get_writer_connection():
+    """Open the connection batches are committed on. Call with _flush_lock held."""
+    global _writer_connection
+    if _writer_connection is None:
+        _get_connection()
+        _writer_connection = sqlite3.connect(HISTORY_DB, check_same_thread=False)
+        _writer_connection.execute('PRAGMA synchronous=FULL')
+    return _writer_connection
+
+def _add_missing_columns(conn):
+    """Bring a database created by an older version up to the current schema."""
+    existing = {row['name'] for row in conn.execute('PRAGMA table_info(posts)')}
+    with conn:
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f'ALTER TABLE posts ADD COLUMN {column} {column_type}')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_posts_reply_id ON posts (reply_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_posts_reply_checked ON posts (reply_checked_at) '
+                     'WHERE reply_id IS NOT NULL')
+
+def use_database(db_file):
+    """Switch the history to a different database file, e.g. for replays and benchmarks."""
+    global HISTORY_DB, _connection, _aggregates, _writer_connection
+    flush()
+    with _flush_lock, _lock:
+        # The journal belongs to the old database; the next write opens a new one
+        _close_journal()
+        if _connection is not None:
+            _connection.close()
+        if _writer_connection is not None:
+            _writer_connection.close()
+            _writer_connection = None
+        HISTORY_DB = db_file
+        _connection = None
+        _aggregates = None
+        _get_connection()
+    _recover_journals()
+
+def _row_to_post(row):
+    """Convert a database row to the post dictionary used throughout the bot."""
+    return {
+        'post_id': row['post_id'],
+        'subreddit': row['subreddit'],
+        'template_name': row['template_name'],
+        'timestamp': row['timestamp'],
+        'reply_id': row['reply_id']
+    }
+
+def _to_unix_timestamp(value):
+    """Normalise a legacy timestamp (Unix seconds or ISO string) to Unix seconds."""
+    if isinstance(value, str):
+        try:
+            return int(datetime.fromisoformat(value).timestamp())
+        except ValueError:
+            return int(float(value))
+    return int(value)
+
+def _build_aggregates(conn):
+    """Compute the running totals from the database and the archive summaries."""
+    total, first_timestamp, last_timestamp = conn.execute(
+        'SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM posts'
+    ).fetchone()
+    recent = [_row_to_post(row) for row in conn.execute(
+        f'SELECT {POST_COLUMNS} FROM posts ORDER BY id DESC LIMIT ?', (RECENT_POSTS_SIZE,)
+    )]
+    aggregates = {
+        'data_version': conn.execute('PRAGMA data_version').fetchone()[0],
+        'total_posts': total,
+        'archived_posts': 0,
+        'subreddits': dict(conn.execute(
+            'SELECT subreddit, COUNT(*) FROM posts GROUP BY subreddit'
+        ).fetchall()),
+        'templates': dict(conn.execute(
+            'SELECT template_name, COUNT(*) FROM posts GROUP BY template_name'
+        ).fetchall()),
+        'first_timestamp': first_timestamp,
+        'last_timestamp': last_timestamp,
+        'recent': deque(reversed(recent), maxlen=RECENT_POSTS_SIZE)
+    }
+
+    # Archived months only contribute their stored totals; nothing is decompressed
+    for segment in conn.execute('SELECT * FROM archive_segments'):
+        aggregates['total_posts'] += segment['post_count']
+        aggregates['archived_posts'] += segment['post_count']
+        for key in ('subreddits', 'templates'):
+            for name, count in json.loads(segment[key]).items():
+                aggregates[key][name] = aggregates[key].get(name, 0) + count
+        if aggregates['first_timestamp'] is None or segment['first_timestamp'] < aggregates['first_timestamp']:
+            aggregates['first_timestamp'] = segment['first_timestamp']
+        if aggregates['last_timestamp'] is None or segment['last_timestamp'] > aggregates['last_timestamp']:
+            aggregates['last_timestamp'] = segment['last_timestamp']
+    return aggregates
+
+def _get_aggregates():
+    """Return the running totals, rebuilding them if another connection changed the database."""
+    global _aggregates
+    conn = _get_connection()
+    with _lock:
+        if _aggregates is None or \
+                conn.execute('PRAGMA data_version').fetchone()[0] != _aggregates['data_version']:
+            _aggregates = _build_aggregates(conn)
+            # Posts still waiting for the writer are not in the database yet
+            with _buffer_condition:
+                for post in _committing + _buffer:
+                    _update_aggregates(post)
+        return _aggregates
+
+def _update_aggregates(post_data):
+    """Fold a newly written post into the running totals."""
+    if _aggregates is None:
+        return
+    subreddit = post_data['subreddit']
+    template = post_data['template_name']
+    timestamp = post_data['timestamp']
+    _aggregates['total_posts'] += 1
+    _aggregates['subreddits'][subreddit] = _aggregates['subreddits'].get(subreddit, 0) + 1
+    _aggregates['templates'][template] = _aggregates['templates'].get(template, 0) + 1
+    if _aggregates['first_timestamp'] is None or timestamp < _aggregates['first_timestamp']:
+        _aggregates['first_timestamp'] = timestamp
+    if _aggregates['last_timestamp'] is None or timestamp > _aggregates['last_timestamp']:
+        _aggregates['last_timestamp'] = timestamp
+    _aggregates['recent'].append(dict(post_data))
+
 def initialize_history():
-    """Initialize the post history file if it doesn't exist."""
-    if not os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump([], f)
-        logger.info(f"Created new post history file: {HISTORY_FILE}")
-
-def add_post_to_history(post_id, subreddit, template_name, timestamp=None):
-    """Add a post to the history."""
-    if timestamp is None:
-        timestamp = int(datetime.now().timestamp())
-    
-    # Load existing history
+    """Initialize the post history database, recovering journals left by crashed
+    processes and migrating any legacy JSON history."""
+    _get_connection()
+    _recover_journals()
+    if os.path.exists(HISTORY_FILE):
+        migrate_json_history(HISTORY_FILE)
+
+def migrate_json_history(json_file=HISTORY_FILE):
+    """Import a legacy JSON history file into the database.
+
+    The file is renamed with a '.migrated' suffix afterwards so the import
+    only ever runs once. Returns the number of posts imported.
+    """
+    global _aggregates
     try:
-        with open(HISTORY_FILE, 'r') as f:
+        with open(json_file, 'r') as f:
             history = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        history = []
-    
-    # Add new post
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not read legacy history file {json_file}: {e}")
+        return 0
+
+    rows = []
+    for post in history:
+        try:
+            rows.append((
+                post['post_id'],
+                post['subreddit'],
+                post.get('template_name', post.get('template_used')),
+                _to_unix_timestamp(post['timestamp']),
+                None
+            ))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping malformed history entry {post!r}: {e}")
+
+    conn = _get_connection()
+    with _lock, conn:
+        conn.executemany(f'INSERT INTO posts ({POST_COLUMNS}) VALUES (?, ?, ?, ?, ?)', rows)
+        _aggregates = None
+
+    os.replace(json_file, json_file + '.migrated')
+    logger.info(f"Migrated {len(rows)} posts from {json_file} to {HISTORY_DB}")
+    return len(rows)
+
+def add_post_to_history(post_id, subreddit, template_name, timestamp=None, reply_id=None):
+    """Add a post to the history.
+
+    `reply_id` is the id of our reply comment, used to track how it fares.
+    The post shows up in the stats and recent posts straight away and is
+    committed to the database with the next batch.
+    """
+    global _buffer_started
+    if timestamp is None:
+        timestamp = int(datetime.now().timestamp())
+
     post_data = {
         'post_id': post_id,
         'subreddit': subreddit,
         'template_name': template_name,
-        'timestamp': timestamp
+        'timestamp': timestamp,
+        'reply_id': reply_id
     }
-    
-    history.append(post_data)
-    
-    # Save updated history
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(history, f, indent=2)
-    
+
+    # Journal the post and leave it for the background writer
+    _start_writer()
+    with _lock:
+        with _buffer_condition:
+            _journal.write(json.dumps(post_data) + '\n')
+            _journal.flush()
+            os.fsync(_journal.fileno())
+            if not _buffer:
+                _buffer_started = time.monotonic()
+            _buffer.append(post_data)
+            # Wake the writer to start the flush timer, or to commit a full batch
+            if len(_buffer) == 1 or len(_buffer) >= HISTORY_BATCH_SIZE:
+                _buffer_condition.notify()
+        _update_aggregates(post_data)
+
     logger.info(f"Added post to history: {post_id} in r/{subreddit}")
     return post_data
 
-def get_history(limit=None, subreddit=None, template=None):
-    """Get post history, optionally filtered by subreddit or template."""
+def _journal_paths(pid=None):
+    """A process's journal being appended to, the one holding the batch being
+    committed, and its lock file."""
+    prefix = f"{HISTORY_DB}.{os.getpid() if pid is None else pid}"
+    return prefix + '.pending', prefix + '.committing', prefix + '.lock'
+
+def _start_writer():
+    """Open this process's journal and start the background writer."""
+    global _journal, _journal_lock, _writer
+    with _buffer_condition:
+        if _journal is None:
+            pending_path, _, lock_path = _journal_paths()
+            _journal_lock = open(lock_path, 'a')
+            fcntl.flock(_journal_lock, fcntl.LOCK_EX)
+            _journal = open(pending_path, 'a')
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_batches, name='history-writer', daemon=True)
+            _writer.start()
+
+def _close_journal():
+    """Close this process's journal, removing it if everything in it is committed."""
+    global _journal, _journal_lock
+    with _buffer_condition:
+        if _journal is None:
+            return
+        pending_path, committing_path, lock_path = _journal_paths()
+        _journal.close()
+        _journal = None
+        if not (_buffer or _committing or os.path.exists(committing_path)):
+            os.remove(pending_path)
+            os.remove(lock_path)
+        # Otherwise the next recovery replays what is left
+        _journal_lock.close()
+        _journal_lock = None
+
+def _read_journal(path):
+    rows = []
     try:
-        with open(HISTORY_FILE, 'r') as f:
-            history = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        history = []
-    
-    # Apply filters
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    post = json.loads(line)
+                    rows.append((post['post_id'], post['subreddit'], post['template_name'],
+                                 post['timestamp'], post.get('reply_id')))
+                except (ValueError, KeyError):
+                    # A line cut short by the crash
+                    continue
+    except FileNotFoundError:
+        pass
+    return rows
+
+def _recover_journals():
+    """Commit posts journaled by processes that crashed, skipping any that already
+    reached the database. Journals of processes still running are locked and left alone."""
+    global _aggregates
+    pids = {path.rsplit('.', 2)[-2] for pattern in ('*.pending', '*.committing', '*.lock')
+            for path in glob.glob(glob.escape(HISTORY_DB) + '.' + pattern)}
+    for pid in sorted(pid for pid in pids if pid.isdigit()):
+        pending_path, committing_path, lock_path = _journal_paths(pid)
+        with open(lock_path, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            rows = _read_journal(committing_path) + _read_journal(pending_path)
+            if rows:
+                conn = _get_connection()
+                with _lock, conn:
+                    conn.executemany(
+                        f'INSERT INTO posts ({POST_COLUMNS}) SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS '
+                        '(SELECT 1 FROM posts WHERE post_id = ? AND timestamp = ?)',
+                        [row + (row[0], row[3]) for row in rows]
+                    )
+                    _aggregates = None
+                logger.info(f"Recovered {len(rows)} journaled posts into {HISTORY_DB}")
+            for path in (pending_path, committing_path, lock_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+def _write_batches():
+    """Commit buffered posts whenever a batch fills up or the oldest has waited long enough."""
+    while True:
+        with _buffer_condition:
+            while not _buffer:
+                _buffer_condition.wait()
+            while _buffer and len(_buffer) < HISTORY_BATCH_SIZE:
+                remaining = _buffer_started + HISTORY_FLUSH_SECONDS - time.monotonic()
+                if remaining <= 0:
+                    break
+                _buffer_condition.wait(remaining)
+        try:
+            flush()
+        except sqlite3.Error as e:
+            # The batch is back in the buffer; try again after a pause
+            logger.error(f"Could not write post history, retrying: {e}")
+            time.sleep(HISTORY_FLUSH_SECONDS)
+
+def _swap_journal(pending_path, committing_path):
+    """Move the journal aside for the batch being committed. Call with _buffer_condition held.
+
+    A journal left by a failed commit holds posts that were put back in the
+    buffer, so the new one is appended to it rather than replacing it.
+    """
+    global _journal
+    _journal.close()
+    if os.path.exists(committing_path):
+        with open(pending_path, 'r') as source, open(committing_path, 'a') as target:
+            target.write(source.read())
+            target.flush()
+            os.fsync(target.fileno())
+        os.remove(pending_path)
+    else:
+        os.replace(pending_path, committing_path)
+    _journal = open(pending_path, 'a')
+
+def flush():
+    """Commit all buffered posts to the database now. Returns the number written.
+
+    If the commit fails the posts go back in the buffer and the error is raised.
+    """
+    global _buffer, _buffer_started, _committing, _aggregates
+    with _flush_lock:
+        pending_path, committing_path, _ = _journal_paths()
+        with _buffer_condition:
+            if not _buffer:
+                return 0
+            batch = _committing = _buffer
+            _buffer = []
+            # Posts arriving during the commit start a new journal
+            _swap_journal(pending_path, committing_path)
+
+        with _lock:
+            aggregates = _aggregates
+            up_to_date = aggregates is not None and \
+                _get_connection().execute('PRAGMA data_version').fetchone()[0] == aggregates['data_version']
+
+        conn = _get_writer_connection()
+        try:
+            with metrics.span('history_flush'), conn:
+                conn.executemany(
+                    f'INSERT INTO posts ({POST_COLUMNS}) VALUES (?, ?, ?, ?, ?)',
+                    [(post['post_id'], post['subreddit'], post['template_name'], post['timestamp'],
+                      post['reply_id']) for post in batch]
+                )
+        except Exception:
+            # Keep the batch, and its journal, for the next flush
+            with _buffer_condition:
+                _buffer = batch + _buffer
+                _committing = []
+                _buffer_started = time.monotonic()
+            raise
+        os.remove(committing_path)
+
+        with _lock:
+            with _buffer_condition:
+                _committing = []
+            if _aggregates is not aggregates:
+                # Rebuilt during the commit, possibly counting the batch twice
+                _aggregates = None
+            elif up_to_date:
+                # The totals already include the batch; only the commit changed the version
+                _aggregates['data_version'] = _get_connection().execute('PRAGMA data_version').fetchone()[0]
+        return len(batch)
+
+# Commit whatever is buffered when the interpreter exits normally
+atexit.register(_close_journal)
+atexit.register(flush)
+
+def has_post(post_id):
+    """Check whether a reply to the post is recorded, including one not yet written."""
+    conn = _get_connection()
+    with _lock:
+        with _buffer_condition:
+            if any(post['post_id'] == post_id for post in _committing + _buffer):
+                return True
+        return conn.execute('SELECT 1 FROM posts WHERE post_id = ? LIMIT 1', (post_id,)).fetchone() is not None
+
+def get_replies_to_check(max_age, min_interval, limit, now=None):
+    """Get the ids of replies up to `max_age` seconds old not checked in the last `min_interval` seconds.
+
+    Replies never checked come first, then those checked longest ago. Deleted
+    replies are not checked again; removed ones are, as they can be restored.
+    """
+    flush()
+    now = now if now is not None else time.time()
+    conn = _get_connection()
+    with _lock:
+        rows = conn.execute(
+            'SELECT reply_id FROM posts WHERE reply_id IS NOT NULL AND timestamp >= ? '
+            'AND (reply_checked_at IS NULL OR reply_checked_at <= ?) AND reply_state IS NOT ? '
+            'ORDER BY reply_checked_at IS NOT NULL, reply_checked_at LIMIT ?',
+            (int(now - max_age), int(now - min_interval), REPLY_DELETED, limit)
+        ).fetchall()
+    return [row['reply_id'] for row in rows]
+
+def record_reply_outcomes(outcomes, checked_at=None):
+    """Store (reply_id, score, state) results for tracked replies."""
+    checked_at = int(checked_at if checked_at is not None else time.time())
+    conn = _get_connection()
+    with _lock, conn:
+        conn.executemany(
+            'UPDATE posts SET reply_score = ?, reply_state = ?, reply_checked_at = ? WHERE reply_id = ?',
+            [(score, state, checked_at, reply_id) for reply_id, score, state in outcomes]
+        )
+
+def get_reply_health():
+    """Summarise how the tracked replies are doing, per template and per subreddit.
+
+    Covers the replies still in the database, i.e. the retention window.
+    A live reply with a score of 0 or less counts as downvoted. This scans
+    the whole table, so it runs on a connection of its own rather than
+    holding up the bot's writes and lookups on the shared one.
+    """
+    _get_connection()
+    conn = sqlite3.connect(HISTORY_DB)
+    conn.row_factory = sqlite3.Row
+    health = {}
+    with closing(conn):
+        for key, column in (('templates', 'template_name'), ('subreddits', 'subreddit')):
+            rows = conn.execute(
+                f"SELECT {column} AS name, COUNT(*) AS tracked, "
+                f"SUM(reply_state = '{REPLY_LIVE}') AS live, "
+                f"SUM(reply_state = '{REPLY_REMOVED}') AS removed, "
+                f"SUM(reply_state = '{REPLY_DELETED}') AS deleted, "
+                f"SUM(reply_state = '{REPLY_LIVE}' AND reply_score <= 0) AS downvoted, "
+                f"AVG(CASE WHEN reply_state = '{REPLY_LIVE}' THEN reply_score END) AS average_score "
+                f"FROM posts WHERE reply_state IS NOT NULL GROUP BY {column}"
+            ).fetchall()
+            health[key] = {row['name']: {
+                'tracked': row['tracked'],
+                'live': row['live'],
+                'removed': row['removed'],
+                'deleted': row['deleted'],
+                'downvoted': row['downvoted'],
+                'removal_rate': row['removed'] / row['tracked'],
+                'average_score': row['average_score']
+            } for row in rows}
+    return health
+
+def _filter_conditions(subreddit=None, template=None, since=None, until=None):
+    """Build the WHERE conditions and parameters for the history filters."""
+    conditions = []
+    params = []
+
     if subreddit:
-        history = [post for post in history if post['subreddit'].lower() == subreddit.lower()]
-    
+        conditions.append('subreddit = ? COLLATE NOCASE')
+        params.append(subreddit)
+
     if template:
-        history = [post for post in history if post['template_used'].lower() == template.lower()]
-    
+        conditions.append('template_name = ? COLLATE NOCASE')
+        params.append(template)
+
+    if since is not None:
+        conditions.append('timestamp >= ?')
+        params.append(since)
+
+    if until is not None:
+        conditions.append('timestamp <= ?')
+        params.append(until)
+
+    return conditions, params
+
+def get_history(limit=None, subreddit=None, template=None):
+    """Get post history, optionally filtered by subreddit or template."""
+    flush()
+    query = f'SELECT {POST_COLUMNS} FROM posts'
+
+    # Apply filters
+    conditions, params = _filter_conditions(subreddit, template)
+
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+
     # Sort by timestamp (newest first)
-    history.sort(key=lambda x: x['timestamp'], reverse=True)
-    
+    query += ' ORDER BY timestamp DESC, id DESC'
+
     # Apply limit
     if limit and limit > 0:
-        history = history[:limit]
-    
-    return history
+        query += ' LIMIT ?'
+        params.append(limit)
+
+    conn = _get_connection()
+    with _lock:
+        return [_row_to_post(row) for row in conn.execute(query, params)]
+
+def parse_cursor(cursor):
+    """Split a 'timestamp:id' page cursor into its parts."""
+    try:
+        timestamp, row_id = cursor.split(':')
+        return int(timestamp), int(row_id)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+
+def get_history_page(limit=HISTORY_PAGE_SIZE, cursor=None, subreddit=None, template=None,
+                     since=None, until=None):
+    """Get one page of post history, newest first.
+
+    Pages are keyed on (timestamp, id), so each page costs the same however far
+    back it is. `since` and `until` are inclusive Unix timestamps. Returns the
+    posts and the cursor for the next page, which is None on the last page.
+    """
+    flush()
+    conditions, params = _filter_conditions(subreddit, template, since, until)
+
+    if cursor:
+        timestamp, row_id = parse_cursor(cursor)
+        conditions.append('(timestamp < ? OR (timestamp = ? AND id < ?))')
+        params.extend([timestamp, timestamp, row_id])
+
+    query = f'SELECT id, {POST_COLUMNS} FROM posts'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY timestamp DESC, id DESC LIMIT ?'
+    params.append(limit + 1)
+
+    conn = _get_connection()
+    with _lock:
+        rows = conn.execute(query, params).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['timestamp']}:{rows[-1]['id']}"
+
+    return [_row_to_post(row) for row in rows], next_cursor
 
 def get_stats():
     """Get statistics about bot activity."""
-    try:
-        with open(HISTORY_FILE, 'r') as f:
-            history = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        history = []
-    
-    if not history:
+    with _lock:
+        aggregates = _get_aggregates()
+        
+        if not aggregates['total_posts']:
+            return {
+                'total_posts': 0,
+                'archived_posts': 0,
+                'subreddits': {},
+                'templates': {}
+            }
+        
         return {
-            'total_posts': 0,
-            'subreddits': {},
-            'templates': {}
+            'total_posts': aggregates['total_posts'],
+            'archived_posts': aggregates['archived_posts'],
+            'subreddits': dict(aggregates['subreddits']),
+            'templates': dict(aggregates['templates']),
+            'first_post': datetime.fromtimestamp(aggregates['first_timestamp']).isoformat(),
+            'last_post': datetime.fromtimestamp(aggregates['last_timestamp']).isoformat()
         }
-    
-    # Count posts by subreddit
+
+def get_post_count():
+    """Get the total number of posts in the history."""
+    with _lock:
+        return _get_aggregates()['total_posts']
+
+def get_recent_posts(limit=5):
+    """Get the most recent posts, newest first."""
+    with _lock:
+        recent = _get_aggregates()['recent']
+        return [dict(post) for post in list(reversed(recent))[:limit]]
+
+def clear_history():
+    """Clear the post history, including the archives."""
+    global _aggregates
+    flush()
+    conn = _get_connection()
+    with _lock, conn:
+        paths = [row['path'] for row in conn.execute('SELECT path FROM archive_segments')]
+        conn.execute('DELETE FROM posts')
+        conn.execute('DELETE FROM archive_segments')
+        _aggregates = None
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    logger.info("Post history cleared")
+
+def get_all_posts(include_archived=False):
+    """Get all posts from history.
+
+    Only posts inside the retention window are kept in the database; pass
+    `include_archived` to read the archived months as well, oldest first.
+    """
+    flush()
+    posts = []
+    if include_archived:
+        for segment in get_archive_segments():
+            posts.extend(iter_archive(segment['month']))
+    conn = _get_connection()
+    with _lock:
+        posts.extend(_row_to_post(row) for row in conn.execute(
+            f'SELECT {POST_COLUMNS} FROM posts ORDER BY id'
+        ))
+    return posts
+
+def _month_of(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m')
+
+def _read_segment(path):
+    """Read the rows of an archive segment, keyed by their original database id."""
+    rows = {}
+    try:
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                row = json.loads(line)
+                rows[row['id']] = row
+    except FileNotFoundError:
+        pass
+    return rows
+
+def _summarise(rows):
+    """Compute the totals stored alongside an archive segment."""
     subreddits = {}
-    for post in history:
-        subreddit = post['subreddit']
-        if subreddit in subreddits:
-            subreddits[subreddit] += 1
-        else:
-            subreddits[subreddit] = 1
-    
-    # Count posts by template
     templates = {}
-    for post in history:
-        template = post['template_used']
-        if template in templates:
-            templates[template] += 1
-        else:
-            templates[template] = 1
-    
-    # Get first and last post timestamps
-    timestamps = [datetime.fromisoformat(post['timestamp']) for post in history]
-    first_post = min(timestamps).isoformat()
-    last_post = max(timestamps).isoformat()
-    
+    for row in rows:
+        subreddits[row['subreddit']] = subreddits.get(row['subreddit'], 0) + 1
+        templates[row['template_name']] = templates.get(row['template_name'], 0) + 1
     return {
-        'total_posts': len(history),
-        'subreddits': subreddits,
-        'templates': templates,
-        'first_post': first_post,
-        'last_post': last_post
+        'post_count': len(rows),
+        'first_timestamp': min(row['timestamp'] for row in rows),
+        'last_timestamp': max(row['timestamp'] for row in rows),
+        'subreddits': json.dumps(subreddits),
+        'templates': json.dumps(templates)
     }
 
-def clear_history():
-    """Clear the post history."""
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump([], f)
-    logger.info("Post history cleared")
+def compact_history(retention_days=HISTORY_RETENTION_DAYS, now=None):
+    """Move posts older than the retention window into monthly archive segments.
 
-def get_all_posts():
-    """Get all posts from history."""
-    try:
-        with open(HISTORY_FILE, 'r') as f:
-            history = json.load(f)
-        return history
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    Each month is a gzip JSON-lines file in ARCHIVE_DIR with its totals in the
+    archive_segments table. Segments are rewritten before the posts are deleted
+    and merged by row id, so a crash part way through never loses or doubles
+    a post. Returns the number of posts archived.
+    """
+    global _aggregates
+    if not retention_days or retention_days <= 0:
+        return 0
+    flush()
+    cutoff = int((now if now is not None else time.time()) - retention_days * 86400)
+    conn = _get_connection()
+    with _lock:
+        rows = conn.execute(
+            f'SELECT id, {POST_COLUMNS}, {OUTCOME_COLUMNS} FROM posts WHERE timestamp < ? ORDER BY id',
+            (cutoff,)
+        ).fetchall()
+    if not rows:
+        return 0
+
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(_month_of(row['timestamp']), []).append(dict(row))
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for month, month_rows in sorted(by_month.items()):
+        path = os.path.join(ARCHIVE_DIR, f"post_history-{month}.jsonl.gz")
+        merged = _read_segment(path)
+        merged.update((row['id'], row) for row in month_rows)
+        ordered = sorted(merged.values(), key=lambda row: row['id'])
+
+        temp_file = path + '.tmp'
+        with gzip.open(temp_file, 'wt') as f:
+            for row in ordered:
+                f.write(json.dumps(row) + '\n')
+        with open(temp_file, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+
+        summary = _summarise(ordered)
+        with _lock, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO archive_segments (month, path, post_count, first_timestamp, '
+                'last_timestamp, subreddits, templates) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (month, path, summary['post_count'], summary['first_timestamp'],
+                 summary['last_timestamp'], summary['subreddits'], summary['templates'])
+            )
+            conn.executemany('DELETE FROM posts WHERE id = ?', [(row['id'],) for row in month_rows])
+            _aggregates = None
+        logger.info(f"Archived {len(month_rows)} posts from {month} to {path}")
+
+    return len(rows)
+
+def get_archive_segments():
+    """Get the summary of each archived month, oldest first."""
+    conn = _get_connection()
+    with _lock:
+        segments = conn.execute('SELECT * FROM archive_segments ORDER BY month').fetchall()
+    return [{
+        'month': segment['month'],
+        'path': segment['path'],
+        'post_count': segment['post_count'],
+        'first_timestamp': segment['first_timestamp'],
+        'last_timestamp': segment['last_timestamp'],
+        'subreddits': json.loads(segment['subreddits']),
+        'templates': json.loads(segment['templates'])
+    } for segment in segments]
+
+def iter_archive(month):
+    """Yield the posts archived for a 'YYYY-MM' month, oldest first."""
+    conn = _get_connection()
+    with _lock:
+        segment = conn.execute('SELECT path FROM archive_segments WHERE month = ?', (month,)).fetchone()
+    if segment is None:
+        return
+    for row in sorted(_read_segment(segment['path']).values(), key=lambda row: row['id']):
+        yield {key: row.get(key) for key in ('post_id', 'subreddit', 'template_name', 'timestamp', 'reply_id')}
 
-# Initialize history file when module is imported
+# Initialize history database when module is imported
 initialize_history()
@@ -0,0 +1,107 @@
+"""
+Profiler for Reddit Bot
+Samples the stacks of the running threads (the bot, its stream and reply
+workers, and the web interface) without restarting anything, producing
+collapsed stacks that flamegraph tools read directly
+
+Only served by the web interface when DEBUG_ENDPOINTS = True in config.py.
+"""
+import os
+import re
+import sys
+import time
+import logging
+import threading
+import traceback
+from collections import Counter
+import config
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Whether the web interface serves /debug/profile and /debug/stacks
+DEBUG_ENDPOINTS = getattr(config, 'DEBUG_ENDPOINTS', False)
+
+# Time between samples, in seconds
+PROFILE_INTERVAL = 0.01
+
+# Longest profile that can be requested, in seconds
+MAX_PROFILE_SECONDS = getattr(config, 'DEBUG_PROFILE_MAX_SECONDS', 60)
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+# One profile at a time keeps the overhead bounded
+_profile_lock = threading.Lock()
+
+def _thread_label(thread):
+    # Unnamed threads, such as the web server's request threads, are numbered
+    # per request; drop the number so their samples add up
+    if thread is None:
+        return 'unknown'
+    return re.sub(r'^Thread-\d+', 'Thread', thread.name)
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _collapse(label, frame):
+    """Return the stack as 'thread;outermost;...;innermost'."""
+    frames = []
+    while frame is not None:
+        frames.append(_frame_label(frame))
+        frame = frame.f_back
+    frames.append(label)
+    return ';'.join(reversed(frames))
+
+def _selected(label, threads):
+    return not threads or any(label.startswith(prefix) for prefix in threads)
+
+def sample(seconds, interval=PROFILE_INTERVAL, threads=None):
+    """Sample every thread's stack for `seconds` and return (Counter of stacks, samples taken).
+
+    `threads` is an optional list of thread name prefixes, e.g.
+    ['reddit-bot', 'stream-']. The calling thread is never sampled.
+    """
+    seconds = min(max(seconds, 0), MAX_PROFILE_SECONDS)
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        own_ident = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            by_ident = {thread.ident: thread for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                label = _thread_label(by_ident.get(ident))
+                if _selected(label, threads):
+                    stacks[_collapse(label, frame)] += 1
+            samples += 1
+            time.sleep(interval)
+        logger.info(f"Profiled for {seconds}s: {samples} samples, {len(stacks)} distinct stacks")
+        return stacks, samples
+    finally:
+        _profile_lock.release()
+
+def format_collapsed(stacks):
+    """Render stacks in the collapsed format: one 'frame;frame;... count' line per stack."""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def dump_stacks():
+    """Return the current stack of every thread as readable text."""
+    by_ident = {thread.ident: thread for thread in threading.enumerate()}
+    sections = []
+    for ident, frame in sys._current_frames().items():
+        thread = by_ident.get(ident)
+        name = thread.name if thread else 'unknown'
+        daemon = ', daemon' if thread and thread.daemon else ''
+        sections.append(f"Thread {name} ({ident}{daemon}):\n" + ''.join(traceback.format_stack(frame)))
+    return '\n'.join(sections)
@@ -0,0 +1,76 @@
+"""
+Rate Limiting for Reddit Bot
+Token bucket used to pace replies, and parsing of the wait time Reddit asks
+for in RATELIMIT errors
+"""
+import re
+import time
+import threading
+import config
+
+# Sustained reply rate and how many replies may be sent back to back
+REPLY_RATE_PER_MINUTE = getattr(config, 'REPLY_RATE_PER_MINUTE', 6)
+REPLY_BURST = getattr(config, 'REPLY_BURST', 1)
+
+# Wait used when Reddit rate limits us without saying for how long, in seconds
+DEFAULT_RATELIMIT_WAIT = 600
+
+RATELIMIT_WAIT_PATTERN = re.compile(r'(\d+)\s*(millisecond|second|minute|hour)s?', re.IGNORECASE)
+UNIT_SECONDS = {'millisecond': 0.001, 'second': 1, 'minute': 60, 'hour': 3600}
+
+def parse_ratelimit_wait(error):
+    """Return the wait in seconds requested by a RATELIMIT error, or None for other errors."""
+    text = str(error)
+    if 'RATELIMIT' not in text.upper():
+        return None
+    match = RATELIMIT_WAIT_PATTERN.search(text)
+    if not match:
+        return DEFAULT_RATELIMIT_WAIT
+    return int(match.group(1)) * UNIT_SECONDS[match.group(2).lower()]
+
+class TokenBucket:
+    """Token bucket rate limiter that can also be paused for a fixed time."""
+
+    def __init__(self, rate_per_minute=REPLY_RATE_PER_MINUTE, capacity=REPLY_BURST):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return the seconds until one is."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            if self.rate <= 0:
+                return float('inf')
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """Refuse tokens for the given number of seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.tokens = 0
+            self.updated = now
+
+    def seconds_until_available(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                return 0
+            return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
@@ -6,11 +6,22 @@ and automatically responds with helpful information based on the post content.
 """
 import praw
 import time
+import importlib
 import logging
+import threading
 from datetime import datetime
 import config
+import account_pool
+import matching_stage
 import message_templates
+import metrics
 import post_history
+import reply_check
+import reply_dispatcher
+import reply_tracker
+import seen_posts
+import stream_checkpoints
+import stream_shards
 import subreddit_manager
 
 # Set up logging
@@ -24,124 +35,302 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def create_reddit_instance():
-    """Create and return a Reddit instance using credentials from config."""
+# How often the subreddit configuration is checked for changes, in seconds
+CONFIG_CHECK_INTERVAL = 5
+
+# How often history older than the retention window is archived, in seconds
+HISTORY_COMPACT_INTERVAL = 3600
+
+# How long queued replies may keep sending after a stop before they are saved, in seconds
+DRAIN_TIMEOUT = getattr(config, 'DRAIN_TIMEOUT', 30)
+
+# Creates Reddit clients; see set_client_factory and REDDIT_CLIENT_FACTORY
+_client_factory = None
+
+def create_praw_client(account):
+    """Log in to Reddit with praw; keys in `account` override the main credentials."""
+    return praw.Reddit(
+        client_id=account.get('client_id', config.CLIENT_ID),
+        client_secret=account.get('client_secret', config.CLIENT_SECRET),
+        user_agent=account.get('user_agent', config.USER_AGENT),
+        username=account.get('username', config.USERNAME),
+        password=account.get('password', config.PASSWORD)
+    )
+
+def set_client_factory(factory):
+    """Create Reddit clients with `factory(account)` from now on; None restores the default.
+
+    Used to swap in a local stand-in such as fake_reddit for load tests.
+    """
+    global _client_factory
+    _client_factory = factory
+
+def get_client_factory():
+    """Return the factory set with set_client_factory, then REDDIT_CLIENT_FACTORY, then praw."""
+    if _client_factory is not None:
+        return _client_factory
+    path = getattr(config, 'REDDIT_CLIENT_FACTORY', None)
+    if not path:
+        return create_praw_client
+    module_name, _, name = path.rpartition('.')
+    return getattr(importlib.import_module(module_name), name)
+
+def create_reddit_instance(account=None):
+    """Create and return a Reddit instance using credentials from config.
+    
+    `account` is an entry from config.ACCOUNTS; its keys override the main
+    credentials. The client comes from the configured client factory.
+    """
     try:
-        reddit = praw.Reddit(
-            client_id=config.CLIENT_ID,
-            client_secret=config.CLIENT_SECRET,
-            user_agent=config.USER_AGENT,
-            username=config.USERNAME,
-            password=config.PASSWORD
-        )
+        reddit = get_client_factory()(account or {})
         logger.info(f"Logged in as {reddit.user.me()}")
         return reddit
     except Exception as e:
         logger.error(f"Failed to create Reddit instance: {e}")
         return None
 
-def contains_keywords(text, keywords):
-    """Check if any of the keywords are in the text."""
-    text = text.lower()
-    return any(keyword.lower() in text for keyword in keywords)
-
 def get_best_template(text):
     """Find the best message template for the given text based on keyword matches."""
     return message_templates.get_template_for_text(text)
 
-def already_replied(post, reddit_user):
-    """Check if the bot has already replied to this post."""
-    post.comments.replace_more(limit=0)
-    for comment in post.comments.list():
-        if comment.author and comment.author.name == reddit_user:
-            logger.info(f"Already replied to post {post.id}")
-            return True
-    return False
-
-def monitor_subreddits(reddit):
-    """Monitor subreddits for new posts containing keywords and reply with the appropriate template."""
+def is_new_post(post, processed_posts):
+    """Check a post against the seen index, marking it seen if it is new."""
+    if post.id in processed_posts:
+        return False
+    processed_posts.add(post.id)
+    return True
+
+def handle_match(post, template, dispatcher, reply_checker):
+    """Queue a reply for a matched post unless the bot already replied to it.
+
+    Returns the template name, or None if no reply was queued.
+    """
+    if not template:
+        return None
+    
+    template_name = template['name']
+    logger.info(f"Found post with keywords in r/{post.subreddit.display_name}: {post.title}")
+    
+    # A reply the dispatcher would drop as stale is not worth a comment scan
+    if dispatcher.too_old(post):
+        return None
+    
+    # Check if we've already replied
+    with metrics.span('already_replied'):
+        replied = reply_checker.already_replied(post)
+    if replied:
+        return None
+    
+    # Hand the reply to the dispatcher so we keep reading new posts
+    if not dispatcher.submit(post, template['message'], template_name):
+        return None
+    reply_checker.mark_replied(post.id)
+    return template_name
+
+def process_post(post, processed_posts, dispatcher, reply_checker):
+    """Run one submission through dedup, matching and the reply check.
+
+    Queues a reply on the dispatcher and returns the chosen template name,
+    or returns None if the post is skipped.
+    """
+    # Skip if we've already processed this post
+    if not is_new_post(post, processed_posts):
+        return None
+    
+    # A single pass of the keyword matcher both filters and scores the post
+    with metrics.span('match'):
+        template = get_best_template(matching_stage.post_text(post))
+    return handle_match(post, template, dispatcher, reply_checker)
+
+def monitor_subreddits(reddit, stop_event=None, pause_event=None, status_callback=None):
+    """Monitor subreddits for new posts containing keywords and reply with the appropriate template.
+    
+    Runs until `stop_event` is set (or forever without one). While `pause_event`
+    is set no new posts are taken and no replies are sent. On the way out,
+    queued replies get DRAIN_TIMEOUT seconds to go out and any left are saved
+    for the next start.
+    """
+    if stop_event is None:
+        stop_event = threading.Event()
+    
+    def report(action):
+        if status_callback:
+            status_callback(action)
+        else:
+            logger.info(action)
+    
+    def queue_replies(results):
+        for post, template in results:
+            template_name = handle_match(post, template, dispatcher, reply_checker)
+            if template_name:
+                report(f"Queued {template_name} reply to post {post.id} in r/{post.subreddit.display_name}")
+    
+    ingestion = None
+    dispatcher = None
+    matching = None
+    processed_posts = None
+    reply_checker = None
+    checkpoints = None
     try:
-        # Get subreddits from the subreddit manager
-        subreddits = subreddit_manager.get_all_subreddits()
+        # Get the enabled subreddits from the subreddit manager
+        subreddits = subreddit_manager.get_active_subreddits()
+        config_version = subreddit_manager.get_config_version()
+        last_config_check = time.time()
+        last_compaction = 0
+        last_reply_track = 0
         
         if not subreddits:
             logger.error("No subreddits configured or enabled. Please add subreddits in the manager.")
+            report("No subreddits configured or enabled")
             return
         
-        # Create a multi-subreddit instance
-        multi_subreddit = reddit.subreddit('+'.join(subreddits))
+        # Split the subreddits into streams that run concurrently, each catching up
+        # from its checkpoints on posts made while the bot was stopped
+        checkpoints = stream_checkpoints.StreamCheckpoints()
+        ingestion = stream_shards.ShardedIngestion(reddit, stream_shards.build_shards(), checkpoints)
+        
+        # Log in the reply accounts; a reply from any of them counts as ours
+        pool = account_pool.create_account_pool(reddit)
+        reply_checker = reply_check.ReplyChecker(
+            [reddit.user.me().name] + [account.username for account in pool.accounts[1:]])
+        
+        # Track posts we've handled to avoid duplicates, persisted across restarts
+        processed_posts = seen_posts.SeenPosts()
         
-        # Get the bot's username
-        bot_username = reddit.user.me().name
+        # Post replies from a background thread under the configured rate limit,
+        # starting with any left over from the last run
+        dispatcher = reply_dispatcher.ReplyDispatcher(pool)
+        dispatcher.load_pending(reddit)
+        dispatcher.load_handoffs(reddit)
+        dispatcher.start()
         
-        # Track posts we've seen to avoid duplicates
-        processed_posts = set()
+        # Match post text inline or on worker threads or processes, per MATCH_EXECUTION
+        matching = matching_stage.MatchingStage()
         
-        # Get all keywords from all templates
-        all_keywords = message_templates.get_all_keywords()
+        # Export the components' own counters alongside the stage timings
+        metrics.register_collector('dispatcher', dispatcher.metrics)
+        metrics.register_collector('streams', ingestion.metrics)
+        metrics.register_collector('matching', matching.metrics)
+        metrics.register_collector('reply_check', reply_checker.metrics)
         
         logger.info(f"Starting to monitor {len(subreddits)} subreddits: {', '.join(subreddits)}")
-        logger.info(f"Loaded {len(message_templates.TEMPLATES)} different message templates")
+        logger.info(f"Loaded {message_templates.get_template_count()} different message templates")
         
-        # Monitor new submissions
-        for post in multi_subreddit.stream.submissions(skip_existing=True):
-            # Skip if we've already processed this post
-            if post.id in processed_posts:
+        ingestion.start()
+        report(f"Monitoring {len(subreddits)} subreddits")
+        
+        # Monitor new submissions from every shard
+        paused = False
+        while not stop_event.is_set():
+            if pause_event is not None and pause_event.is_set():
+                if not paused:
+                    paused = True
+                    dispatcher.pause()
+                    report("Bot paused")
+                stop_event.wait(1)
                 continue
+            if paused:
+                paused = False
+                dispatcher.resume()
+                report("Bot resumed")
+            
+            # Archive old history and check on recent replies in the background
+            if time.time() - last_compaction >= HISTORY_COMPACT_INTERVAL:
+                last_compaction = time.time()
+                compact_history()
             
-            processed_posts.add(post.id)
+            if reply_tracker.REPLY_TRACK_INTERVAL and \
+                    time.time() - last_reply_track >= reply_tracker.REPLY_TRACK_INTERVAL:
+                last_reply_track = time.time()
+                track_reply_outcomes(reddit)
             
-            # Combine title and selftext for keyword matching
-            post_text = post.title + ' ' + post.selftext
+            # Pick up subreddit changes made from the manager or web interface
+            if time.time() - last_config_check >= CONFIG_CHECK_INTERVAL:
+                last_config_check = time.time()
+                latest_version = subreddit_manager.get_config_version()
+                if latest_version != config_version:
+                    config_version = latest_version
+                    if ingestion.update_shards(stream_shards.build_shards(previous=ingestion.layout)):
+                        report(f"Reloaded subreddits, now monitoring {len(ingestion.subreddits)}")
+                # Queue replies handed over by history_scan
+                dispatcher.load_handoffs(reddit)
             
-            # Check if post contains any keywords from any template
-            if contains_keywords(post_text, all_keywords):
-                logger.info(f"Found post with keywords in r/{post.subreddit.display_name}: {post.title}")
-                
-                # Get the best template for this post
-                template = get_best_template(post_text)
-                template_name = "unknown"
-                
-                # Determine which template was matched
-                for name, info in message_templates.TEMPLATES.items():
-                    if template == info['template']:
-                        template_name = name
-                        break
-                
-                if not template:
-                    logger.warning(f"No suitable template found for post {post.id} despite keyword match")
-                    continue
-                
-                # Check if we've already replied
-                if not already_replied(post, bot_username):
-                    try:
-                        # Reply to the post with the selected template
-                        reply = post.reply(template)
-                        
-                        # Log the reply in post history
-                        post_history.add_post(
-                            post_id=post.id,
-                            subreddit=post.subreddit.display_name,
-                            title=post.title,
-                            template_name=template_name
-                        )
-                        
-                        logger.info(f"Replied to post: {post.id} - {post.title} with {template_name} template")
-                        
-                        # Wait to avoid rate limiting
-                        time.sleep(10)
-                    except Exception as e:
-                        logger.error(f"Error replying to post {post.id}: {e}")
-                        
-                        # If we're being rate limited, wait longer
-                        if "RATELIMIT" in str(e):
-                            logger.warning("Rate limited. Waiting 10 minutes...")
-                            time.sleep(600)
+            # Poll quickly while posts are being matched so their replies are not held up
+            post = ingestion.get(timeout=0.05 if matching.pending else 1)
+            if post is not None:
+                checkpoints.record(post)
+                if is_new_post(post, processed_posts):
+                    matching.submit(post)
+            
+            # Replies are queued in arrival order whichever worker finishes first
+            queue_replies(matching.completed(block=matching.full))
     
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
         logger.error(f"Error in monitor_subreddits: {e}")
+        report(f"Error: {e}")
+    finally:
+        shutdown(ingestion, dispatcher, processed_posts, report, matching, queue_replies, checkpoints)
+        if reply_checker is not None:
+            checks = reply_checker.metrics()
+            logger.info(f"Reply checks: {checks['checks']}, comment scans: {checks['scans']}, "
+                        f"scans saved: {checks['scans_saved']}")
+
+def compact_history():
+    """Archive old history on a background thread so the streams are not held up."""
+    def run():
+        try:
+            archived = post_history.compact_history()
+            if archived:
+                logger.info(f"Archived {archived} posts older than {post_history.HISTORY_RETENTION_DAYS} days")
+        except Exception as e:
+            logger.error(f"Error archiving post history: {e}")
+    
+    threading.Thread(target=run, name='history-compaction', daemon=True).start()
+
+def track_reply_outcomes(reddit):
+    """Refresh the score and removal state of recent replies on a background thread."""
+    def run():
+        try:
+            reply_tracker.track_replies(reddit)
+        except Exception as e:
+            logger.error(f"Error checking reply outcomes: {e}")
+    
+    threading.Thread(target=run, name='reply-tracker', daemon=True).start()
+
+def shutdown(ingestion, dispatcher, processed_posts, report, matching=None, queue_replies=None,
+             checkpoints=None):
+    """Stop the streams, finish matching, drain or save queued replies and close the stores."""
+    if ingestion is not None:
+        report("Stopping streams...")
+        ingestion.stop(timeout=5)
+    if matching is not None:
+        # These posts are already marked seen, so finish them rather than drop them
+        queue_replies(matching.close())
+    if dispatcher is not None:
+        pending = dispatcher.metrics()['queue_depth']
+        if pending:
+            report(f"Sending {pending} queued replies...")
+        remaining = dispatcher.drain(DRAIN_TIMEOUT)
+        dispatcher.save_pending()
+        if remaining:
+            report(f"Saved {remaining} unsent replies for the next start")
+    # Commit replies still waiting in the history write buffer
+    post_history.flush()
+    if processed_posts is not None:
+        processed_posts.close()
+    if checkpoints is not None:
+        checkpoints.close()
+
+def run_bot(status_callback=None, stop_event=None, pause_event=None):
+    """Log in and monitor subreddits until stopped; used by the web interface."""
+    reddit = create_reddit_instance()
+    if not reddit:
+        raise RuntimeError("Failed to initialize Reddit instance")
+    
+    monitor_subreddits(reddit, stop_event=stop_event, pause_event=pause_event,
+                       status_callback=status_callback)
 
 def main():
     """Main function to run the bot."""
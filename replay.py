@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Offline Replay for Reddit Bot
+Feeds recorded or synthetic submissions through the bot's matching, dedup,
+reply and history pipeline without a Reddit account, recording replies in a
+local sink instead of posting them
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import tempfile
+import itertools
+from types import SimpleNamespace
+import message_templates
+import metrics
+import post_history
+import reddit_bot
+import reply_check
+import reply_dispatcher
+import seen_posts
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Username the replay pretends to post as
+REPLAY_USERNAME = 'replay-bot'
+
+# Filler words for synthetic post text
+FILLER_WORDS = (
+    'the a to and of in is it you that he was for on are with as his they be at one have '
+    'this from or had by word but what some we can out other were all there when up use '
+    'your how said an each she which do their time if will way about many then them write '
+    'would like so these her long make thing see him two has look more day could go come '
+    'did number sound no most people my over know water than call first who may down side'
+).split()
+
+class ReplySink:
+    """Collects the replies made during a replay instead of posting them."""
+
+    def __init__(self, username=REPLAY_USERNAME):
+        self.username = username
+        self.replies = []
+        self._by_post = {}
+        self._ids = itertools.count(1)
+
+    def record(self, submission, message):
+        comment = SimpleNamespace(
+            id=f"r{next(self._ids)}",
+            author=SimpleNamespace(name=self.username),
+            body=message
+        )
+        self.replies.append({'post_id': submission.id, 'subreddit': submission.subreddit.display_name})
+        self._by_post.setdefault(submission.id, []).append(comment)
+        return comment
+
+    def comments_for(self, post_id):
+        return list(self._by_post.get(post_id, []))
+
+class ReplayComments:
+    """Stands in for a submission's comment forest."""
+
+    def __init__(self, submission, sink):
+        self._submission = submission
+        self._sink = sink
+
+    def replace_more(self, limit=None):
+        return []
+
+    def list(self):
+        return self._sink.comments_for(self._submission.id)
+
+class ReplaySubmission:
+    """A recorded or synthetic submission with the attributes the bot uses."""
+
+    def __init__(self, sink, id, subreddit, title, selftext='', created_utc=None):
+        self.id = id
+        self.subreddit = SimpleNamespace(display_name=subreddit)
+        self.title = title
+        self.selftext = selftext
+        self.created_utc = created_utc if created_utc is not None else time.time()
+        self.comments = ReplayComments(self, sink)
+        self._sink = sink
+
+    @property
+    def fullname(self):
+        return f"t3_{self.id}"
+
+    def reply(self, body):
+        return self._sink.record(self, body)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'subreddit': self.subreddit.display_name,
+            'title': self.title,
+            'selftext': self.selftext,
+            'created_utc': self.created_utc
+        }
+
+class InlineDispatcher(reply_dispatcher.ReplyDispatcher):
+    """Dispatcher that replies immediately so each post is timed end to end."""
+
+    def submit(self, post, message, template_name):
+        self.send_now(post, message, template_name)
+
+def load_submissions(path, sink):
+    """Read submissions from a JSON-lines file of id/subreddit/title/selftext records."""
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield ReplaySubmission(
+                sink,
+                id=record['id'],
+                subreddit=record['subreddit'],
+                title=record.get('title', ''),
+                selftext=record.get('selftext', ''),
+                created_utc=record.get('created_utc')
+            )
+
+def write_submissions(path, submissions):
+    """Write submissions to a JSON-lines file that load_submissions can read back."""
+    with open(path, 'w') as f:
+        for submission in submissions:
+            f.write(json.dumps(submission.to_dict()) + '\n')
+
+def generate_text(rng, text_length, keywords, keyword_rate):
+    """Generate filler text of about `text_length` characters, sometimes containing a keyword."""
+    words = []
+    length = 0
+    while length < text_length:
+        word = rng.choice(FILLER_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    if keywords and rng.random() < keyword_rate:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+    return ' '.join(words)
+
+def generate_submissions(count, sink, keyword_rate=0.2, text_length=500,
+                         subreddits=('activism', 'mutualaid', 'privacy'), keywords=None, seed=0):
+    """Generate synthetic submissions.
+
+    `keyword_rate` is the fraction of posts that contain a template keyword and
+    `text_length` the approximate selftext length in characters.
+    """
+    rng = random.Random(seed)
+    if keywords is None:
+        keywords = message_templates.get_all_keywords()
+    for i in range(count):
+        yield ReplaySubmission(
+            sink,
+            id=f"syn{seed}x{i}",
+            subreddit=rng.choice(subreddits),
+            title=' '.join(rng.choice(FILLER_WORDS) for _ in range(8)),
+            selftext=generate_text(rng, text_length, keywords, keyword_rate)
+        )
+
+def percentile(values, fraction):
+    """Return the value at the given fraction of the sorted values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_replay(submissions, sink, work_dir=None):
+    """Run submissions through the bot pipeline and return throughput figures.
+
+    History and the seen posts index are written to `work_dir` (a temporary
+    directory by default) so the real databases are never touched.
+    """
+    own_dir = None
+    if work_dir is None:
+        own_dir = tempfile.TemporaryDirectory(prefix='replay-')
+        work_dir = own_dir.name
+
+    previous_db = post_history.HISTORY_DB
+    post_history.use_database(os.path.join(work_dir, 'post_history.db'))
+    processed_posts = seen_posts.SeenPosts(db_file=os.path.join(work_dir, 'seen_posts.db'))
+    dispatcher = InlineDispatcher()
+    reply_checker = reply_check.ReplyChecker(sink.username)
+
+    latencies = []
+    matched = 0
+    try:
+        started = time.perf_counter()
+        for submission in submissions:
+            post_started = time.perf_counter()
+            if reddit_bot.process_post(submission, processed_posts, dispatcher, reply_checker):
+                matched += 1
+            latencies.append(time.perf_counter() - post_started)
+        elapsed = time.perf_counter() - started
+    finally:
+        processed_posts.close()
+        post_history.use_database(previous_db)
+        if own_dir is not None:
+            own_dir.cleanup()
+
+    return {
+        'posts': len(latencies),
+        'matched': matched,
+        'replied': dispatcher.stats['sent'],
+        'seconds': elapsed,
+        'posts_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'comment_scans': reply_checker.stats['scans']
+    }
+
+def print_results(results):
+    print(f"Posts processed:  {results['posts']}")
+    print(f"Posts matched:    {results['matched']}")
+    print(f"Replies recorded: {results['replied']}")
+    print(f"Comment scans:    {results['comment_scans']}")
+    print(f"Throughput:       {results['posts_per_second']:.1f} posts/second")
+    print(f"Latency p50/p99:  {results['p50_ms']:.3f} / {results['p99_ms']:.3f} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay submissions through the bot without posting.')
+    parser.add_argument('file', nargs='?', help='JSON-lines file of submissions to replay')
+    parser.add_argument('--generate', type=int, default=1000,
+                        help='number of synthetic submissions when no file is given')
+    parser.add_argument('--keyword-rate', type=float, default=0.2)
+    parser.add_argument('--text-length', type=int, default=500)
+    parser.add_argument('--save', help='write the submissions to this JSON-lines file as well')
+    parser.add_argument('--metrics', action='store_true', help='print per-stage timings afterwards')
+    args = parser.parse_args(argv)
+
+    # Per-post log lines would dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+
+    sink = ReplySink()
+    if args.file:
+        submissions = list(load_submissions(args.file, sink))
+    else:
+        submissions = list(generate_submissions(args.generate, sink, args.keyword_rate, args.text_length))
+    if args.save:
+        write_submissions(args.save, submissions)
+
+    print_results(run_replay(submissions, sink))
+    if args.metrics:
+        print()
+        print(metrics.format_summary())
+
+if __name__ == "__main__":
+    sys.exit(main())
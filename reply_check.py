@@ -0,0 +1,107 @@
+"""
+Reply Check for Reddit Bot
+Decides whether the bot has already replied to a post, using the local
+history and a cache of recent answers before falling back to scanning the
+post's comment tree on Reddit
+"""
+import time
+import logging
+from collections import OrderedDict
+import config
+import post_history
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Posts younger than this, created since the bot started, are assumed to have
+# no reply from us and are not scanned, in seconds; 0 scans every post
+REPLY_CHECK_SCAN_AGE = getattr(config, 'REPLY_CHECK_SCAN_AGE_SECONDS', 300)
+
+# Number of recent answers kept in memory
+REPLY_CHECK_CACHE_SIZE = getattr(config, 'REPLY_CHECK_CACHE_SIZE', 10000)
+
+def scan_comments(post, usernames):
+    """Check the post's comment tree for a comment by any of the usernames."""
+    post.comments.replace_more(limit=0)
+    for comment in post.comments.list():
+        if comment.author and comment.author.name in usernames:
+            return True
+    return False
+
+class ReplyChecker:
+    """Answers "have we replied to this post?" as cheaply as it safely can.
+
+    The checks run in order: the cache of recent answers, the local history,
+    and then, only for posts old enough or created before the bot started
+    (so a previous run may have replied), a scan of the comment tree.
+    """
+
+    def __init__(self, usernames, scan_age=REPLY_CHECK_SCAN_AGE, cache_size=REPLY_CHECK_CACHE_SIZE):
+        self.usernames = {usernames} if isinstance(usernames, str) else set(usernames)
+        self.scan_age = scan_age
+        self.cache_size = cache_size
+        self.started_at = time.time()
+        self._cache = OrderedDict()
+        self.stats = {
+            'checks': 0,
+            'cache_hits': 0,
+            'history_hits': 0,
+            'scans_skipped': 0,
+            'scans': 0,
+            'scan_hits': 0
+        }
+
+    def _remember(self, post_id, replied):
+        self._cache[post_id] = replied
+        self._cache.move_to_end(post_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def needs_scan(self, post, now=None):
+        """Check whether a post is old enough, or old enough to predate this run, to need a scan."""
+        created = getattr(post, 'created_utc', None)
+        if created is None or self.scan_age <= 0:
+            return True
+        return created < self.started_at or (now or time.time()) - created >= self.scan_age
+
+    def already_replied(self, post):
+        """Check if the bot has already replied to this post."""
+        self.stats['checks'] += 1
+        cached = self._cache.get(post.id)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            self._cache.move_to_end(post.id)
+            return cached
+
+        if post_history.has_post(post.id):
+            self.stats['history_hits'] += 1
+            replied = True
+        elif not self.needs_scan(post):
+            self.stats['scans_skipped'] += 1
+            replied = False
+        else:
+            self.stats['scans'] += 1
+            replied = scan_comments(post, self.usernames)
+            if replied:
+                self.stats['scan_hits'] += 1
+
+        if replied:
+            logger.info(f"Already replied to post {post.id}")
+        self._remember(post.id, replied)
+        return replied
+
+    def mark_replied(self, post_id):
+        """Record that a reply to the post has been queued."""
+        self._remember(post_id, True)
+
+    def metrics(self):
+        """Return the check counters, including how many comment scans were avoided."""
+        metrics = dict(self.stats)
+        metrics['scans_saved'] = self.stats['checks'] - self.stats['scans']
+        metrics['cache_size'] = len(self._cache)
+        return metrics
@@ -0,0 +1,397 @@
+"""
+Reply Dispatcher for Reddit Bot
+Queues replies and posts them from one background thread per account, each
+under that account's rate limit, so reading new submissions never waits on
+posting
+"""
+import os
+import glob
+import json
+import time
+import logging
+import threading
+from collections import deque
+import config
+import account_pool
+import event_bus
+import metrics
+import rate_limit
+import post_history
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Replies still queued when the bot stops are saved here and re-queued on start
+PENDING_REPLIES_FILE = 'pending_replies.json'
+
+# Other processes, such as history_scan, hand replies to the bot in files
+# matching this pattern, one per hand-over, so they never write the bot's own
+# file; the running bot picks them up and re-queues them
+HANDOFF_PATTERN = 'pending_replies.*.json'
+
+def handoff_file():
+    """Return a new file name for handing replies over to the bot."""
+    return f'pending_replies.{os.getpid()}-{int(time.time() * 1000)}.json'
+
+# How many times a reply is retried after being rate limited
+MAX_REPLY_ATTEMPTS = 3
+
+# Most replies held in the queue; the stalest is dropped to make room
+REPLY_QUEUE_MAX = getattr(config, 'REPLY_QUEUE_MAX', 500)
+
+# Replies to posts older than this are dropped instead of posted to a stale
+# thread, in seconds; 0 keeps them however old. The streams' catch-up after a
+# restart (BACKFILL_MAX_HOURS) should not reach further back than this.
+REPLY_MAX_AGE = getattr(config, 'REPLY_MAX_AGE_MINUTES', 120) * 60
+
+class ReplyJob:
+    """A reply waiting to be posted."""
+
+    def __init__(self, post, message, template_name, subreddit=None, created_utc=None):
+        self.post = post
+        self.message = message
+        self.template_name = template_name
+        # Kept on the job so scheduling never has to touch a lazy submission
+        self.subreddit = subreddit or post.subreddit.display_name
+        self.created_utc = created_utc
+        self.queued_at = time.time()
+        self.attempts = 0
+        # Age limit it was queued under, e.g. a history scan's; None uses the dispatcher's
+        self.max_age = None
+
+    def age(self, now=None):
+        """Seconds since the post was made, or since the reply was queued if that is unknown."""
+        return (now or time.time()) - (self.created_utc or self.queued_at)
+
+class ReplyDispatcher:
+    """Posts queued replies from one worker thread per account in the pool, each sending as its account."""
+
+    def __init__(self, pool=None, max_queue=REPLY_QUEUE_MAX, max_age=REPLY_MAX_AGE):
+        if pool is None:
+            pool = account_pool.AccountPool([account_pool.Account(account_pool.DEFAULT_USERNAME)])
+        self.pool = pool
+        self.max_queue = max_queue
+        self.max_age = max_age
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._paused = False
+        self.stats = {
+            'sent': 0,
+            'failed': 0,
+            'rate_limited': 0,
+            'dropped_stale': 0,
+            'dropped_full': 0,
+            'rate_limit_wait_seconds': 0.0,
+            'total_queue_wait_seconds': 0.0
+        }
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        """Start a worker thread for each account."""
+        if self.running:
+            return
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._run, args=(account,),
+                             name=f'reply-dispatcher-{account.username}', daemon=True)
+            for account in self.pool.accounts
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker threads, leaving any unsent replies in the queue."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+
+    def pause(self):
+        """Hold queued replies until resume() is called."""
+        with self._condition:
+            self._paused = True
+
+    def resume(self):
+        with self._condition:
+            self._paused = False
+            self._condition.notify_all()
+
+    def drain(self, timeout):
+        """Wait up to `timeout` seconds for the queue to empty, then stop the threads.
+
+        Returns the number of replies still queued.
+        """
+        deadline = time.monotonic() + timeout
+        self.resume()
+        with self._condition:
+            while self._queue and self.running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(min(remaining, 1.0))
+        self.stop()
+        return len(self._queue)
+
+    def _max_age(self, job):
+        return self.max_age if job.max_age is None else job.max_age
+
+    def _is_stale(self, job, now=None):
+        max_age = self._max_age(job)
+        return bool(max_age) and job.age(now) > max_age
+
+    def _drop_stale(self):
+        """Remove replies to posts older than their age limit. Call with the condition held."""
+        now = time.time()
+        stale = [job for job in self._queue if self._is_stale(job, now)]
+        if stale:
+            self._queue = deque(job for job in self._queue if not self._is_stale(job, now))
+            self.stats['dropped_stale'] += len(stale)
+            logger.warning(f"Dropped {len(stale)} queued replies to posts too old to answer")
+
+    def too_old(self, post):
+        """Return True, counting it as dropped, if a reply to the post would be too stale to queue.
+
+        Checked before the reply check so a stale post costs no comment scan.
+        """
+        created_utc = getattr(post, 'created_utc', None)
+        if not self.max_age or created_utc is None or time.time() - created_utc <= self.max_age:
+            return False
+        self._count('dropped_stale')
+        logger.info(f"Skipping post {post.id}, it is older than {self.max_age / 60:.0f} minutes")
+        return True
+
+    def _count(self, key, amount=1):
+        with self._condition:
+            self.stats[key] += amount
+
+    def _make_room(self):
+        """Drop the stalest replies until one more fits. Call with the condition held."""
+        while self.max_queue and len(self._queue) >= self.max_queue:
+            stalest = max(self._queue, key=lambda job: job.age())
+            self._queue.remove(stalest)
+            self.stats['dropped_full'] += 1
+            logger.warning(f"Reply queue full ({self.max_queue}), dropped reply to post {stalest.post.id}")
+
+    def save_pending(self, path=PENDING_REPLIES_FILE):
+        """Write unsent replies to a file so they can be re-queued after a restart."""
+        with self._condition:
+            self._drop_stale()
+            pending = [{
+                'post_id': job.post.id,
+                'subreddit': job.subreddit,
+                'created_utc': job.created_utc,
+                'message': job.message,
+                'template_name': job.template_name,
+                'attempts': job.attempts,
+                'queued_at': job.queued_at,
+                'max_age': self._max_age(job)
+            } for job in self._queue]
+        if not pending:
+            if os.path.exists(path):
+                os.remove(path)
+            return 0
+        temp_file = path + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(pending, f, indent=2)
+        os.replace(temp_file, path)
+        logger.info(f"Saved {len(pending)} pending replies to {path}")
+        return len(pending)
+
+    def load_pending(self, reddit, path=PENDING_REPLIES_FILE):
+        """Re-queue replies saved by save_pending, ahead of any new ones."""
+        try:
+            with open(path, 'r') as f:
+                pending = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except json.JSONDecodeError as e:
+            logger.error(f"Could not read pending replies from {path}: {e}")
+            return 0
+
+        jobs = []
+        for entry in pending:
+            try:
+                post = reddit.submission(id=entry['post_id'])
+                job = ReplyJob(post, entry['message'], entry['template_name'],
+                               entry.get('subreddit'), entry.get('created_utc'))
+            except Exception as e:
+                logger.warning(f"Dropping pending reply to post {entry.get('post_id')}: {e}")
+                continue
+            job.attempts = entry.get('attempts', 0)
+            job.queued_at = entry.get('queued_at', job.queued_at)
+            job.max_age = entry.get('max_age')
+            jobs.append(job)
+        with self._condition:
+            self._queue.extendleft(reversed(jobs))
+            self._drop_stale()
+            # Over the cap, keep the newest of the saved replies
+            while self.max_queue and len(self._queue) > self.max_queue:
+                self._queue.popleft()
+                self.stats['dropped_full'] += 1
+            self._condition.notify_all()
+        os.remove(path)
+        logger.info(f"Re-queued {len(jobs)} pending replies from {path}")
+        return len(jobs)
+
+    def load_handoffs(self, reddit):
+        """Re-queue replies handed over by other processes. Returns the number queued."""
+        return sum(self.load_pending(reddit, path) for path in sorted(glob.glob(HANDOFF_PATTERN)))
+
+    def submit(self, post, message, template_name):
+        """Queue a reply to a post, dropping the stalest queued reply if the queue is full.
+
+        Returns False if the post is too old to answer and nothing was queued.
+        """
+        job = ReplyJob(post, message, template_name, created_utc=getattr(post, 'created_utc', None))
+        with self._condition:
+            if self._is_stale(job):
+                self.stats['dropped_stale'] += 1
+                logger.warning(f"Not queueing reply to post {post.id}, it is older than "
+                               f"{self.max_age / 60:.0f} minutes")
+                return False
+            self._drop_stale()
+            self._make_room()
+            self._queue.append(job)
+            # Wake every worker, since only some accounts may reply in this subreddit
+            self._condition.notify_all()
+        logger.info(f"Queued reply to post {post.id} ({len(self._queue)} pending)")
+        return True
+
+    def send_now(self, post, message, template_name):
+        """Post a reply immediately as the first account, bypassing the queue and rate limit."""
+        self._send(ReplyJob(post, message, template_name), self.pool.accounts[0])
+
+    def metrics(self):
+        """Return queue depth, wait times, reply counters and per-account figures."""
+        with self._condition:
+            depth = len(self._queue)
+            oldest = self._queue[0].queued_at if self._queue else None
+            metrics = dict(self.stats)
+        accounts = self.pool.metrics()
+        metrics['dropped'] = self.stats['dropped_stale'] + self.stats['dropped_full']
+        metrics['queue_depth'] = depth
+        metrics['oldest_pending_seconds'] = time.time() - oldest if oldest else 0
+        metrics['next_token_seconds'] = min(a['next_token_seconds'] for a in accounts.values())
+        metrics['accounts'] = accounts
+        return metrics
+
+    def _wait(self, seconds):
+        """Sleep for up to the given time, waking early if the dispatcher is stopped."""
+        with self._condition:
+            if not self._stopping:
+                self._condition.wait(seconds)
+            return not self._stopping
+
+    def _next_job(self, account):
+        """Take the oldest job this account may send, if it has budget. Call with the condition held.
+
+        Returns (job, 0); (None, seconds) with the time until the account is
+        expected to have budget; or (None, None) if no queued reply is for it.
+        """
+        self._drop_stale()
+        for index, job in enumerate(self._queue):
+            if self.pool.allows(account, job.subreddit):
+                wait = self.pool.acquire(account)
+                if wait == 0:
+                    del self._queue[index]
+                    return job, 0
+                return None, wait
+        return None, None
+
+    def _run(self, account):
+        """Send queued replies as one account until stopped."""
+        while True:
+            with self._condition:
+                while (not self._queue or self._paused) and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                job, wait = self._next_job(account)
+                if job is None and wait is None:
+                    # Nothing this account may send; wait for more replies
+                    self._condition.wait()
+                    continue
+
+            if job is None:
+                if not self._wait(min(wait, 1.0)):
+                    return
+                continue
+
+            self._send(job, account)
+            with self._condition:
+                # Wake anyone waiting in drain()
+                self._condition.notify_all()
+
+    def _send(self, job, account):
+        post = job.post
+        job.attempts += 1
+        queue_wait = time.time() - job.queued_at
+        self._count('total_queue_wait_seconds', queue_wait)
+        metrics.observe('reply_queue_wait', queue_wait)
+        try:
+            with metrics.span('reply'):
+                comment = account.target_for(post).reply(job.message)
+        except Exception as e:
+            wait = rate_limit.parse_ratelimit_wait(e)
+            if wait is None:
+                self._count('failed')
+                self.pool.record_error(account, e)
+                logger.error(f"Error replying to post {post.id} as {account.username}: {e}")
+                return
+
+            self._count('rate_limited')
+            self._count('rate_limit_wait_seconds', wait)
+            self.pool.record_rate_limit(account, wait)
+            if job.attempts < MAX_REPLY_ATTEMPTS:
+                # Put the reply back at the front so the next free account sends it first
+                with self._condition:
+                    self._queue.appendleft(job)
+                    self._condition.notify_all()
+                logger.warning(f"Account {account.username} rate limited. Pausing it for {wait:.0f} seconds")
+                event_bus.publish('rate_limit', {
+                    'account': account.username,
+                    'wait_seconds': wait,
+                    'until': time.time() + wait,
+                    'queue_depth': len(self._queue)
+                })
+            else:
+                self._count('failed')
+                logger.error(f"Giving up on post {post.id} after {job.attempts} rate limited attempts")
+            return
+
+        self._count('sent')
+        self.pool.record_success(account)
+
+        # Log the reply in post history
+        with metrics.span('add_post_to_history'):
+            post_history.add_post_to_history(
+                post_id=post.id,
+                subreddit=job.subreddit,
+                template_name=job.template_name,
+                reply_id=getattr(comment, 'id', None)
+            )
+        if job.created_utc is not None:
+            metrics.observe('submission_to_reply', time.time() - job.created_utc)
+
+        # Not the title: a job restored from a file holds a lazy submission
+        logger.info(f"Replied to post: {post.id} in r/{job.subreddit} as {account.username} "
+                    f"with {job.template_name} template")
+        event_bus.publish('reply', {
+            'post_id': post.id,
+            'subreddit': job.subreddit,
+            'template_name': job.template_name,
+            'account': account.username,
+            'timestamp': int(time.time())
+        })
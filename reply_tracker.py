@@ -0,0 +1,82 @@
+"""
+Reply Tracker for Reddit Bot
+Periodically looks up the bot's recent replies to learn their score and
+whether they were removed or deleted, fetching up to 100 comments per API
+request, and writes the results into the post history
+"""
+import logging
+import threading
+import config
+import post_history
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# How often the tracker runs from the bot, in seconds
+REPLY_TRACK_INTERVAL = getattr(config, 'REPLY_TRACK_INTERVAL_MINUTES', 10) * 60
+
+# Replies are re-checked at most this often, in seconds
+REPLY_RECHECK_INTERVAL = getattr(config, 'REPLY_RECHECK_MINUTES', 60) * 60
+
+# Replies older than this are no longer tracked, in seconds
+REPLY_TRACK_MAX_AGE = getattr(config, 'REPLY_TRACK_DAYS', 7) * 86400
+
+# Fullnames per info request (Reddit's maximum)
+INFO_BATCH_SIZE = 100
+
+# Replies checked per run, which caps the requests a run makes
+REPLY_TRACK_MAX_PER_RUN = 1000
+
+# Only one run at a time, whoever starts it
+_run_lock = threading.Lock()
+
+def reply_state(comment):
+    """Classify a fetched reply comment as live, removed or deleted, as Reddit reports it to the bot."""
+    body = getattr(comment, 'body', None)
+    if getattr(comment, 'removed', False) or getattr(comment, 'banned_by', None) or body == '[removed]':
+        return post_history.REPLY_REMOVED
+    if comment.author is None or body == '[deleted]':
+        return post_history.REPLY_DELETED
+    return post_history.REPLY_LIVE
+
+def fetch_outcomes(reddit, reply_ids):
+    """Look up replies by id, INFO_BATCH_SIZE per request; return [(reply_id, score, state)].
+
+    Replies Reddit no longer returns at all are reported as deleted.
+    """
+    outcomes = []
+    for start in range(0, len(reply_ids), INFO_BATCH_SIZE):
+        batch = reply_ids[start:start + INFO_BATCH_SIZE]
+        found = {comment.id: comment for comment in reddit.info(fullnames=[f"t1_{reply_id}" for reply_id in batch])}
+        for reply_id in batch:
+            comment = found.get(reply_id)
+            if comment is None:
+                outcomes.append((reply_id, None, post_history.REPLY_DELETED))
+            else:
+                outcomes.append((reply_id, comment.score, reply_state(comment)))
+    return outcomes
+
+def track_replies(reddit, limit=REPLY_TRACK_MAX_PER_RUN):
+    """Refresh the outcome of the replies most in need of a check.
+
+    Returns the number of replies checked, or 0 if a run is already going.
+    """
+    if not _run_lock.acquire(blocking=False):
+        return 0
+    try:
+        reply_ids = post_history.get_replies_to_check(REPLY_TRACK_MAX_AGE, REPLY_RECHECK_INTERVAL, limit)
+        if not reply_ids:
+            return 0
+        outcomes = fetch_outcomes(reddit, reply_ids)
+        post_history.record_reply_outcomes(outcomes)
+        removed = sum(1 for _, _, state in outcomes if state == post_history.REPLY_REMOVED)
+        deleted = sum(1 for _, _, state in outcomes if state == post_history.REPLY_DELETED)
+        logger.info(f"Checked {len(outcomes)} replies: {removed} removed, {deleted} deleted")
+        return len(outcomes)
+    finally:
+        _run_lock.release()
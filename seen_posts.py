@@ -0,0 +1,194 @@
+"""
+Seen Posts Index for Reddit Bot
+Remembers which posts the bot has already handled across restarts, using an
+exact tier for recent posts and Bloom filters for older ones so memory stays
+bounded no matter how long the bot runs
+"""
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import config
+import post_history
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Database to store the seen posts index
+SEEN_POSTS_DB = 'seen_posts.db'
+
+# How long post ids stay in the exact tier before moving into a Bloom filter
+SEEN_POSTS_TTL = getattr(config, 'SEEN_POSTS_TTL_HOURS', 48) * 3600
+
+# Number of ids each Bloom filter generation holds and its false positive rate
+BLOOM_CAPACITY = getattr(config, 'SEEN_POSTS_BLOOM_CAPACITY', 500000)
+BLOOM_ERROR_RATE = getattr(config, 'SEEN_POSTS_BLOOM_ERROR_RATE', 0.001)
+
+# How often expired ids are moved out of the exact tier, in seconds
+EXPIRE_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    post_id TEXT PRIMARY KEY,
+    seen_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bloom (
+    generation TEXT PRIMARY KEY,
+    bits BLOB NOT NULL,
+    count INTEGER NOT NULL
+);
+"""
+
+class BloomFilter:
+    """A fixed-size Bloom filter over string keys."""
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        if bits is None or len(bits) != (self.size + 7) // 8:
+            bits = bytearray((self.size + 7) // 8)
+            count = 0
+        self.bits = bytearray(bits)
+        self.count = count
+
+    def _positions(self, key):
+        """Yield the bit positions for a key using double hashing."""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+class SeenPosts:
+    """Persistent, bounded index of post ids the bot has already handled."""
+
+    def __init__(self, db_file=SEEN_POSTS_DB, ttl=SEEN_POSTS_TTL,
+                 bloom_capacity=BLOOM_CAPACITY, bloom_error_rate=BLOOM_ERROR_RATE):
+        self.ttl = ttl
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self._lock = threading.Lock()
+        self._last_expire = 0
+
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+        # Exact tier, kept in insertion (and therefore time) order
+        self._recent = dict(self._conn.execute(
+            'SELECT post_id, seen_at FROM seen ORDER BY seen_at'
+        ).fetchall())
+
+        # Two Bloom filter generations; the older one is dropped when the newer fills up
+        stored = {generation: (bits, count) for generation, bits, count in
+                  self._conn.execute('SELECT generation, bits, count FROM bloom')}
+        self._current = self._new_bloom(*stored.get('current', (None, 0)))
+        self._previous = self._new_bloom(*stored.get('previous', (None, 0)))
+
+        if not self._recent and not self._current.count and not self._previous.count:
+            self.seed_from_history()
+
+        self.expire()
+        logger.info(f"Loaded seen posts index: {len(self._recent)} recent, "
+                    f"{self._current.count + self._previous.count} archived")
+
+    def _new_bloom(self, bits=None, count=0):
+        return BloomFilter(self.bloom_capacity, self.bloom_error_rate, bits, count)
+
+    def _save_blooms(self):
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO bloom (generation, bits, count) VALUES (?, ?, ?)',
+                [('current', bytes(self._current.bits), self._current.count),
+                 ('previous', bytes(self._previous.bits), self._previous.count)]
+            )
+
+    def _archive(self, post_id):
+        """Move a post id into the current Bloom filter, rotating generations when full."""
+        if self._current.is_full():
+            self._previous = self._current
+            self._current = self._new_bloom()
+        self._current.add(post_id)
+
+    def seed_from_history(self):
+        """Populate the index from the posts recorded in post_history."""
+        cutoff = int(time.time()) - self.ttl
+        posts = sorted(post_history.get_all_posts(), key=lambda post: post['timestamp'])
+        with self._lock, self._conn:
+            for post in posts:
+                if post['timestamp'] >= cutoff:
+                    self._recent[post['post_id']] = post['timestamp']
+                else:
+                    self._archive(post['post_id'])
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO seen (post_id, seen_at) VALUES (?, ?)',
+                self._recent.items()
+            )
+            self._save_blooms()
+        logger.info(f"Seeded seen posts index with {len(posts)} posts from history")
+
+    def __contains__(self, post_id):
+        with self._lock:
+            return (post_id in self._recent or post_id in self._current
+                    or post_id in self._previous)
+
+    def add(self, post_id, seen_at=None):
+        """Record that a post has been handled."""
+        if seen_at is None:
+            seen_at = int(time.time())
+        with self._lock, self._conn:
+            if post_id in self._recent:
+                return
+            self._recent[post_id] = seen_at
+            self._conn.execute(
+                'INSERT OR REPLACE INTO seen (post_id, seen_at) VALUES (?, ?)',
+                (post_id, seen_at)
+            )
+        if seen_at - self._last_expire >= EXPIRE_INTERVAL:
+            self.expire()
+
+    def expire(self):
+        """Move post ids older than the TTL from the exact tier into the Bloom filters."""
+        now = int(time.time())
+        cutoff = now - self.ttl
+        with self._lock, self._conn:
+            self._last_expire = now
+            expired = []
+            for post_id, seen_at in self._recent.items():
+                if seen_at >= cutoff:
+                    break
+                expired.append(post_id)
+            if not expired:
+                return 0
+            for post_id in expired:
+                del self._recent[post_id]
+                self._archive(post_id)
+            self._conn.execute('DELETE FROM seen WHERE seen_at < ?', (cutoff,))
+            self._save_blooms()
+        return len(expired)
+
+    def close(self):
+        """Persist the Bloom filters and close the database."""
+        with self._lock:
+            self._save_blooms()
+            self._conn.close()
@@ -0,0 +1,89 @@
+"""
+Stream Checkpoints for Reddit Bot
+Remembers the newest submission handled in each subreddit, so after a
+restart or crash the streams can page back through the listings and catch
+up on posts made while the bot was down
+"""
+import time
+import sqlite3
+import logging
+import threading
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Database to store the stream checkpoints
+STREAM_CHECKPOINTS_DB = 'stream_checkpoints.db'
+
+# How often new checkpoints are written to the database, in seconds
+CHECKPOINT_SAVE_INTERVAL = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    subreddit TEXT PRIMARY KEY,
+    fullname TEXT NOT NULL,
+    created_utc REAL NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+class StreamCheckpoints:
+    """Newest handled submission per subreddit, persisted across restarts.
+
+    Checkpoints are kept in memory as posts are handled and written out every
+    CHECKPOINT_SAVE_INTERVAL seconds and on close, so a crash can only lose
+    the last few seconds; the backfill catches those up again.
+    """
+
+    def __init__(self, db_file=STREAM_CHECKPOINTS_DB, save_interval=CHECKPOINT_SAVE_INTERVAL):
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._checkpoints = {subreddit: (fullname, created_utc) for subreddit, fullname, created_utc in
+                             self._conn.execute('SELECT subreddit, fullname, created_utc FROM checkpoints')}
+        self._dirty = set()
+        self._last_save = time.time()
+
+    def get(self, subreddit):
+        """Return (fullname, created_utc) of the newest handled post, or None."""
+        with self._lock:
+            return self._checkpoints.get(subreddit.lower())
+
+    def record(self, post):
+        """Move the subreddit's checkpoint forward to this post if it is newer."""
+        subreddit = post.subreddit.display_name.lower()
+        with self._lock:
+            current = self._checkpoints.get(subreddit)
+            if current is None or post.created_utc > current[1]:
+                self._checkpoints[subreddit] = (post.fullname, post.created_utc)
+                self._dirty.add(subreddit)
+        if time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """Write the checkpoints changed since the last save."""
+        with self._lock:
+            self._last_save = time.time()
+            if not self._dirty:
+                return
+            now = int(self._last_save)
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO checkpoints (subreddit, fullname, created_utc, updated_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    [(subreddit,) + self._checkpoints[subreddit] + (now,) for subreddit in self._dirty]
+                )
+            self._dirty.clear()
+
+    def close(self):
+        """Save the checkpoints and close the database."""
+        self.save()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,333 @@
+"""
+Sharded Stream Ingestion for Reddit Bot
+Splits the monitored subreddits into several submission streams that run in
+their own threads and feed a single queue of posts
+"""
+import time
+import queue
+import logging
+import threading
+import config
+import metrics
+import subreddit_manager
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# How subreddits are grouped into streams: 'category', 'size' or 'none' (one stream)
+SHARD_BY = getattr(config, 'SHARD_BY', 'category')
+
+# Largest number of subreddits joined into a single stream
+MAX_SUBREDDITS_PER_SHARD = getattr(config, 'MAX_SUBREDDITS_PER_SHARD', 50)
+
+# Posts waiting to be matched before the streams block
+INGESTION_QUEUE_SIZE = 1000
+
+# Longest wait before a failed stream is restarted, in seconds
+MAX_RESTART_DELAY = 300
+
+# How far back a restarted stream catches up on missed posts, in seconds; 0 turns
+# catching up off. Reddit listings also stop at about 1000 posts.
+BACKFILL_MAX_SECONDS = getattr(config, 'BACKFILL_MAX_HOURS', 2) * 3600
+
+# Posts fetched per listing request while catching up (Reddit's maximum)
+BACKFILL_PAGE_SIZE = 100
+
+def _chunk(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _shard_number(name):
+    """Return n for a shard named 'shard-n', or None for any other name."""
+    if name and name.startswith('shard-') and name[len('shard-'):].isdigit():
+        return int(name[len('shard-'):])
+    return None
+
+def _stable_size_shards(subreddits, previous, max_size):
+    """Fill numbered shards, keeping every subreddit in the shard it was already in.
+
+    New subreddits go to the last shard while it has room, then to new shards,
+    so adding or removing a subreddit only changes the shard it lands in.
+    """
+    wanted = {subreddit.lower() for subreddit in subreddits}
+    placed = set()
+    shards = {}
+    for name, members in sorted((previous or {}).items(), key=lambda item: _shard_number(item[0]) or 0):
+        if _shard_number(name) is None:
+            continue
+        kept = []
+        for subreddit in members:
+            if subreddit.lower() in wanted and subreddit.lower() not in placed and len(kept) < max_size:
+                kept.append(subreddit)
+                placed.add(subreddit.lower())
+        if kept:
+            shards[name] = kept
+
+    for subreddit in subreddits:
+        if subreddit.lower() in placed:
+            continue
+        last = max(shards, key=_shard_number) if shards else None
+        if last is None or len(shards[last]) >= max_size:
+            last = f"shard-{(_shard_number(last) or 0) + 1}"
+            shards[last] = []
+        shards[last].append(subreddit)
+        placed.add(subreddit.lower())
+    return shards
+
+def build_shards(categories=None, shard_by=SHARD_BY, max_size=MAX_SUBREDDITS_PER_SHARD, previous=None):
+    """Group subreddits into named shards, each small enough for one stream.
+
+    Subreddits listed in more than one category are only streamed once. Pass
+    the current shards as `previous` when reloading so 'size' and 'none'
+    shards keep their members and only the changed streams restart.
+    """
+    if categories is None:
+        categories = subreddit_manager.get_active_categories()
+
+    seen = set()
+    grouped = {}
+    for category, subreddits in categories.items():
+        unique = []
+        for subreddit in subreddits:
+            if subreddit.lower() not in seen:
+                seen.add(subreddit.lower())
+                unique.append(subreddit)
+        if unique:
+            grouped[category] = unique
+
+    shards = {}
+    if shard_by == 'category':
+        for category, subreddits in grouped.items():
+            chunks = _chunk(subreddits, max_size)
+            for i, chunk in enumerate(chunks, 1):
+                name = category if len(chunks) == 1 else f"{category} #{i}"
+                shards[name] = chunk
+    else:
+        subreddits = [subreddit for group in grouped.values() for subreddit in group]
+        if shard_by == 'none':
+            max_size = max(1, len(subreddits))
+        shards = _stable_size_shards(subreddits, previous, max_size)
+    return shards
+
+class StreamShard:
+    """A submission stream over one group of subreddits, run in its own thread."""
+
+    def __init__(self, name, subreddits, reddit, output, closed, checkpoints=None):
+        self.name = name
+        self.subreddits = list(subreddits)
+        self.reddit = reddit
+        self.output = output
+        self.checkpoints = checkpoints
+        self._closed = closed
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {
+            'posts': 0,
+            'errors': 0,
+            'last_post_at': None,
+            'lag_seconds': None,
+            'backfilling': False,
+            'backfill_pages': 0,
+            'backfilled': 0
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"stream-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def _put(self, post):
+        """Hand a post to the shared queue, giving up only if ingestion is shut down.
+
+        A shard stopped for a reload still delivers the post it is holding.
+        """
+        while not self._closed.is_set():
+            try:
+                self.output.put(post, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _can_backfill(self):
+        """Check whether any of the shard's subreddits has a checkpoint to catch up from."""
+        if not self.checkpoints or BACKFILL_MAX_SECONDS <= 0:
+            return False
+        return any(self.checkpoints.get(subreddit) for subreddit in self.subreddits)
+
+    def _cutoffs(self):
+        """Return {subreddit: created_utc} of the newest post already covered in each subreddit.
+
+        Subreddits with a checkpoint go back to it, at most BACKFILL_MAX_SECONDS;
+        the rest start from now, as a fresh stream would.
+        """
+        now = time.time()
+        cutoffs = {}
+        for subreddit in self.subreddits:
+            checkpoint = self.checkpoints.get(subreddit) if self.checkpoints else None
+            cutoffs[subreddit.lower()] = max(checkpoint[1], now - BACKFILL_MAX_SECONDS) if checkpoint else now
+        return cutoffs
+
+    def _is_covered(self, post, cutoffs):
+        return post.created_utc <= cutoffs.get(post.subreddit.display_name.lower(), 0)
+
+    def _backfill(self, multi_subreddit, cutoffs):
+        """Page back through the newest posts to the checkpoints and deliver the missed ones, oldest first.
+
+        Each subreddit's cutoff moves up to the newest post delivered, so the
+        stream that follows does not deliver them again.
+        """
+        oldest = min(cutoffs.values())
+        missed = []
+        after = None
+        self.stats['backfilling'] = True
+        try:
+            while not self._stop.is_set():
+                page = list(multi_subreddit.new(limit=BACKFILL_PAGE_SIZE,
+                                                params={'after': after} if after else None))
+                self.stats['backfill_pages'] += 1
+                missed.extend(post for post in page if not self._is_covered(post, cutoffs))
+                if len(page) < BACKFILL_PAGE_SIZE or page[-1].created_utc <= oldest:
+                    break
+                after = page[-1].fullname
+                logger.info(f"Catching up stream shard {self.name}: {len(missed)} missed posts, "
+                            f"back to {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(page[-1].created_utc))}")
+        finally:
+            self.stats['backfilling'] = False
+        
+        if missed:
+            logger.info(f"Stream shard {self.name} caught up on {len(missed)} posts missed while stopped")
+        for post in reversed(missed):
+            self.stats['backfilled'] += 1
+            metrics.inc('posts_backfilled')
+            self._deliver(post)
+            subreddit = post.subreddit.display_name.lower()
+            cutoffs[subreddit] = max(cutoffs.get(subreddit, 0), post.created_utc)
+
+    def _deliver(self, post):
+        now = time.time()
+        self.stats['posts'] += 1
+        self.stats['last_post_at'] = now
+        self.stats['lag_seconds'] = now - post.created_utc
+        metrics.observe('stream_lag', self.stats['lag_seconds'])
+        metrics.inc('posts_received')
+        self._put(post)
+
+    def _run(self):
+        delay = 1
+        while not self._stop.is_set():
+            try:
+                multi_subreddit = self.reddit.subreddit('+'.join(self.subreddits))
+                cutoffs = self._cutoffs()
+                backfill = self._can_backfill()
+                if backfill:
+                    self._backfill(multi_subreddit, cutoffs)
+                # After catching up the stream starts with the newest posts rather than
+                # skipping them, so nothing posted during the catch-up is lost; posts it
+                # repeats are filtered here or by the seen index.
+                # pause_after=0 yields None between fetches so the stop flag is checked
+                polled = time.perf_counter()
+                for post in multi_subreddit.stream.submissions(skip_existing=not backfill, pause_after=0):
+                    # Time inside the stream, including its own wait between fetches
+                    metrics.observe('stream_poll', time.perf_counter() - polled)
+                    if self._stop.is_set():
+                        break
+                    if post is not None and not (backfill and self._is_covered(post, cutoffs)):
+                        self._deliver(post)
+                        delay = 1
+                    polled = time.perf_counter()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Error in stream shard {self.name}: {e}. Restarting in {delay} seconds")
+                self._stop.wait(delay)
+                delay = min(delay * 2, MAX_RESTART_DELAY)
+
+class ShardedIngestion:
+    """Runs one stream per shard and merges their posts into a single queue."""
+
+    def __init__(self, reddit, shards, checkpoints=None, queue_size=INGESTION_QUEUE_SIZE):
+        self.reddit = reddit
+        self.checkpoints = checkpoints
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._closed = threading.Event()
+        self.shards = {name: self._new_shard(name, subreddits)
+                       for name, subreddits in shards.items()}
+        self.started_at = None
+
+    def _new_shard(self, name, subreddits):
+        return StreamShard(name, subreddits, self.reddit, self.queue, self._closed, self.checkpoints)
+
+    @property
+    def layout(self):
+        """The current {shard name: subreddits}, to pass to build_shards as `previous`."""
+        return {name: list(shard.subreddits) for name, shard in self.shards.items()}
+
+    @property
+    def subreddits(self):
+        return [subreddit for shard in self.shards.values() for subreddit in shard.subreddits]
+
+    def start(self):
+        self.started_at = time.time()
+        for shard in self.shards.values():
+            shard.start()
+        logger.info(f"Started {len(self.shards)} stream shards: {', '.join(self.shards)}")
+
+    def stop(self, timeout=None):
+        self._closed.set()
+        for shard in self.shards.values():
+            shard.stop()
+        for shard in self.shards.values():
+            shard.join(timeout)
+
+    def update_shards(self, shards):
+        """Switch to a new set of shards, restarting only the streams that changed.
+
+        Posts already queued by a replaced stream are kept.
+        """
+        changed = False
+        for name in list(self.shards):
+            if shards.get(name) != self.shards[name].subreddits:
+                self.shards.pop(name).stop()
+                logger.info(f"Stopped stream shard {name}")
+                changed = True
+
+        for name, subreddits in shards.items():
+            if name not in self.shards:
+                shard = self._new_shard(name, subreddits)
+                self.shards[name] = shard
+                if self.started_at is not None:
+                    shard.start()
+                logger.info(f"Started stream shard {name} with {len(subreddits)} subreddits")
+                changed = True
+        return changed
+
+    def get(self, timeout=None):
+        """Return the next post from any shard, or None if none arrives in time."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def metrics(self):
+        """Return per-shard throughput and lag counters under 'shards'."""
+        elapsed = max(time.time() - (self.started_at or time.time()), 1e-9)
+        shards = {}
+        for name, shard in self.shards.items():
+            stats = dict(shard.stats)
+            stats['subreddits'] = len(shard.subreddits)
+            stats['posts_per_minute'] = shard.stats['posts'] * 60 / elapsed
+            stats['alive'] = shard.is_alive()
+            shards[name] = stats
+        return {'shards': shards}
@@ -3,8 +3,11 @@ Subreddit Manager for Reddit Bot
 Manages the list of subreddits the bot monitors
 """
 import os
+import copy
 import json
+import functools
 import logging
+import threading
 import config
 
 # Set up logging
@@ -32,55 +35,144 @@ def initialize_config():
         
         logger.info(f"Created new subreddit configuration file: {SUBREDDIT_CONFIG_FILE}")
 
+# Parsed configuration shared by every thread, reloaded when the file changes on disk
+_cache = {
+    'data': None,
+    'signature': None,
+    'version': 0
+}
+_lock = threading.RLock()
+
+def _file_signature():
+    """Return the modification time, inode and size of the configuration file."""
+    try:
+        stat = os.stat(SUBREDDIT_CONFIG_FILE)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+def _load_config():
+    """Return the cached configuration, re-reading the file only if it changed.
+
+    The returned dictionary is shared; callers must hold _lock and must not
+    modify it except through _store_config.
+    """
+    with _lock:
+        signature = _file_signature()
+        if _cache['data'] is not None and signature == _cache['signature']:
+            return _cache['data']
+        
+        try:
+            with open(SUBREDDIT_CONFIG_FILE, 'r') as f:
+                config_data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # If file doesn't exist or is invalid, initialize it
+            initialize_config()
+            with open(SUBREDDIT_CONFIG_FILE, 'r') as f:
+                config_data = json.load(f)
+            signature = _file_signature()
+        
+        if config_data != _cache['data']:
+            _cache['version'] += 1
+        _cache['data'] = config_data
+        _cache['signature'] = signature
+        return config_data
+
+def _store_config(config_data):
+    """Write the configuration to disk atomically and make it the cached copy."""
+    with _lock:
+        temp_file = SUBREDDIT_CONFIG_FILE + '.tmp'
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(config_data, f, indent=2)
+            os.replace(temp_file, SUBREDDIT_CONFIG_FILE)
+        except OSError:
+            # The cached copy may have been changed in place; reload it from disk
+            _cache['data'] = None
+            raise
+        
+        _cache['version'] += 1
+        _cache['data'] = config_data
+        _cache['signature'] = _file_signature()
+
+def _synchronized(func):
+    """Run a read-modify-write of the configuration while holding the lock."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            return func(*args, **kwargs)
+    return wrapper
+
 def get_config():
     """Get the current subreddit configuration."""
-    try:
-        with open(SUBREDDIT_CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # If file doesn't exist or is invalid, initialize it
-        initialize_config()
-        with open(SUBREDDIT_CONFIG_FILE, 'r') as f:
-            return json.load(f)
+    with _lock:
+        return copy.deepcopy(_load_config())
+
+def get_config_version():
+    """Get a number that increases every time the subreddit configuration changes."""
+    with _lock:
+        _load_config()
+        return _cache['version']
 
 def save_config(config_data):
     """Save the subreddit configuration."""
-    with open(SUBREDDIT_CONFIG_FILE, 'w') as f:
-        json.dump(config_data, f, indent=2)
+    _store_config(copy.deepcopy(config_data))
     logger.info("Subreddit configuration saved")
 
 def get_all_subreddits():
     """Get a list of all subreddits from all categories."""
-    config_data = get_config()
     all_subreddits = []
     
-    for category, subreddits in config_data['categories'].items():
-        all_subreddits.extend(subreddits)
+    with _lock:
+        for category, subreddits in _load_config()['categories'].items():
+            all_subreddits.extend(subreddits)
     
     return all_subreddits
 
 def get_active_subreddits():
     """Get a list of all active subreddits."""
-    config_data = get_config()
     active_subreddits = []
     
-    for category, subreddits in config_data['categories'].items():
-        if category in config_data['enabled_categories']:
-            active_subreddits.extend(subreddits)
+    for category, subreddits in get_active_categories().items():
+        active_subreddits.extend(subreddits)
     
     return active_subreddits
 
+def get_active_categories():
+    """Get the enabled categories and their subreddits, leaving out disabled subreddits."""
+    with _lock:
+        config_data = _load_config()
+        disabled = set(config_data.get('disabled_subreddits', []))
+        return {category: [subreddit for subreddit in subreddits if subreddit not in disabled]
+                for category, subreddits in config_data['categories'].items()
+                if category in config_data['enabled_categories']}
+
+def get_subreddit_categories():
+    """Get every category with its subreddits and whether each one is being monitored."""
+    with _lock:
+        config_data = _load_config()
+        disabled = set(config_data.get('disabled_subreddits', []))
+        return {category: [{'name': subreddit,
+                            'enabled': category in config_data['enabled_categories']
+                                       and subreddit not in disabled}
+                           for subreddit in subreddits]
+                for category, subreddits in config_data['categories'].items()}
+
 def get_categories():
     """Get a list of all categories and their subreddits."""
-    return get_config()['categories']
+    with _lock:
+        return {category: list(subreddits)
+                for category, subreddits in _load_config()['categories'].items()}
 
 def get_enabled_categories():
     """Get a list of enabled categories."""
-    return get_config()['enabled_categories']
+    with _lock:
+        return list(_load_config()['enabled_categories'])
 
+@_synchronized
 def add_subreddit(category, subreddit):
     """Add a subreddit to a category."""
-    config_data = get_config()
+    config_data = _load_config()
     
     # Check if category exists
     if category not in config_data['categories']:
@@ -94,13 +186,14 @@ def add_subreddit(category, subreddit):
     
     # Add subreddit
     config_data['categories'][category].append(subreddit)
-    save_config(config_data)
+    _store_config(config_data)
     logger.info(f"Added subreddit '{subreddit}' to category '{category}'")
     return True
 
+@_synchronized
 def remove_subreddit(category, subreddit):
     """Remove a subreddit from a category."""
-    config_data = get_config()
+    config_data = _load_config()
     
     # Check if category exists
     if category not in config_data['categories']:
@@ -114,13 +207,14 @@ def remove_subreddit(category, subreddit):
     
     # Remove subreddit
     config_data['categories'][category].remove(subreddit)
-    save_config(config_data)
+    _store_config(config_data)
     logger.info(f"Removed subreddit '{subreddit}' from category '{category}'")
     return True
 
+@_synchronized
 def enable_category(category):
     """Enable a category."""
-    config_data = get_config()
+    config_data = _load_config()
     
     # Check if category exists
     if category not in config_data['categories']:
@@ -134,13 +228,14 @@ def enable_category(category):
     
     # Enable category
     config_data['enabled_categories'].append(category)
-    save_config(config_data)
+    _store_config(config_data)
     logger.info(f"Enabled category '{category}'")
     return True
 
+@_synchronized
 def disable_category(category):
     """Disable a category."""
-    config_data = get_config()
+    config_data = _load_config()
     
     # Check if category exists
     if category not in config_data['categories']:
@@ -154,13 +249,14 @@ def disable_category(category):
     
     # Disable category
     config_data['enabled_categories'].remove(category)
-    save_config(config_data)
+    _store_config(config_data)
     logger.info(f"Disabled category '{category}'")
     return True
 
+@_synchronized
 def add_category(category_name):
     """Add a new category."""
-    config_data = get_config()
+    config_data = _load_config()
     
     # Check if category already exists
     if category_name in config_data['categories']:
@@ -169,13 +265,14 @@ def add_category(category_name):
     
     # Add category
     config_data['categories'][category_name] = []
-    save_config(config_data)
+    _store_config(config_data)
     logger.info(f"Added category '{category_name}'")
     return True
 
+@_synchronized
 def remove_category(category_name):
     """Remove a category."""
-    config_data = get_config()
+    config_data = _load_config()
     
     # Check if category exists
     if category_name not in config_data['categories']:
@@ -188,9 +285,29 @@ def remove_category(category_name):
     
     # Remove category
     del config_data['categories'][category_name]
-    save_config(config_data)
+    _store_config(config_data)
     logger.info(f"Removed category '{category_name}'")
     return True
 
+@_synchronized
+def toggle_subreddit(subreddit):
+    """Enable a disabled subreddit or disable an enabled one."""
+    config_data = _load_config()
+    
+    # Check if subreddit exists in any category
+    if not any(subreddit in subreddits for subreddits in config_data['categories'].values()):
+        logger.error(f"Subreddit '{subreddit}' does not exist")
+        return False
+    
+    disabled = config_data.setdefault('disabled_subreddits', [])
+    if subreddit in disabled:
+        disabled.remove(subreddit)
+        logger.info(f"Enabled subreddit '{subreddit}'")
+    else:
+        disabled.append(subreddit)
+        logger.info(f"Disabled subreddit '{subreddit}'")
+    _store_config(config_data)
+    return True
+
 # Initialize configuration file when module is imported
 initialize_config()
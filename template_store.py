@@ -0,0 +1,136 @@
+"""
+Template Store for Reddit Bot
+Keeps the message templates in a SQLite database with a version number that
+goes up on every change, so edits survive restarts and other processes can
+tell cheaply when to reload
+"""
+import json
+import sqlite3
+import logging
+import threading
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+# Database to store the templates
+TEMPLATES_DB = 'templates.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    keywords TEXT NOT NULL,
+    message TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_templates_version ON templates (version);
+CREATE TABLE IF NOT EXISTS store_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+"""
+
+class TemplateStore:
+    """Durable, versioned storage for message templates.
+
+    Every template row records the store version that last changed it, so a
+    reader at version N only needs the rows with a higher version.
+    """
+
+    def __init__(self, db_file=TEMPLATES_DB, seed=None):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        # Autocommit mode, so writes can take the database lock up front with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        if seed:
+            self._seed(seed)
+
+    def _seed(self, templates):
+        """Store the built-in templates as version 1 if the store is new."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._conn.execute('SELECT 1 FROM store_version').fetchone() is None:
+                    self._conn.executemany(
+                        'INSERT INTO templates (name, position, keywords, message, description, version) '
+                        'VALUES (?, ?, ?, ?, ?, 1)',
+                        [(name, position, json.dumps(list(data['keywords'])), data['message'],
+                          data.get('description', '')) for position, (name, data) in enumerate(templates.items())]
+                    )
+                    self._conn.execute('INSERT INTO store_version (id, version) VALUES (1, 1)')
+                    logger.info(f"Created template store {self.db_file} with {len(templates)} templates")
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def get_version(self):
+        """Get the current store version; 0 for an empty store."""
+        with self._lock:
+            row = self._conn.execute('SELECT version FROM store_version').fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, version):
+        """Return (current version, {name: template}) for templates changed after `version`.
+
+        Templates come back in their display order.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT version FROM store_version').fetchone()
+            rows = self._conn.execute(
+                'SELECT name, keywords, message, description FROM templates '
+                'WHERE version > ? ORDER BY position', (version,)
+            ).fetchall()
+        changes = {name: {
+            'keywords': json.loads(keywords),
+            'message': message,
+            'description': description
+        } for name, keywords, message, description in rows}
+        return (row[0] if row else 0), changes
+
+    def save(self, name, keywords, message, description=None):
+        """Add or update a template and return the new store version."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT version FROM store_version').fetchone()
+                version = (row[0] if row else 0) + 1
+                existing = self._conn.execute(
+                    'SELECT description FROM templates WHERE name = ?', (name,)
+                ).fetchone()
+                if existing:
+                    self._conn.execute(
+                        'UPDATE templates SET keywords = ?, message = ?, description = ?, version = ? '
+                        'WHERE name = ?',
+                        (json.dumps(list(keywords)), message,
+                         existing[0] if description is None else description, version, name)
+                    )
+                else:
+                    position = self._conn.execute(
+                        'SELECT COALESCE(MAX(position) + 1, 0) FROM templates'
+                    ).fetchone()[0]
+                    self._conn.execute(
+                        'INSERT INTO templates (name, position, keywords, message, description, version) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (name, position, json.dumps(list(keywords)), message, description or '', version)
+                    )
+                self._conn.execute('INSERT OR REPLACE INTO store_version (id, version) VALUES (1, ?)',
+                                   (version,))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        logger.info(f"Saved template {name} (template store version {version})")
+        return version
+
+    def close(self):
+        with self._lock:
+            self._conn.close()